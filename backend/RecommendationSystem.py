@@ -1,27 +1,39 @@
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 import numpy as np
-from sklearn.decomposition import TruncatedSVD
 from sklearn.metrics.pairwise import cosine_similarity
 import pandas as pd
 from typing import List, Dict, Tuple, Optional
 from collections import defaultdict
 import datetime
+import threading
 import logging
 
 # Import models
 from models import User, Post, Like, Visit
 import models
-from database import SessionLocal
+import crud
+import metrics
+import candidate_sources
+import recommender_model
+import recommendation_scoring
+import seen_items
+import training
+from database import ReadSessionLocal
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Número de posts similares por defecto de /similar y /page (y el que calienta warmup): la caché
+# guarda la lista calculada para un n, así que calentar con otro n cambiaría el resultado servido
+SIMILAR_POSTS_N = 5
+
 class RecommendationSystem:
     def __init__(self):
-        self.db = SessionLocal()
+        # Una sesión por hilo: los endpoints llaman a este objeto desde varios hilos del threadpool
+        self._local = threading.local()
         # Cache para resultados de recomendaciones
         self.user_based_recommendations_cache = {}
         self.content_based_recommendations_cache = {}
@@ -33,80 +45,40 @@ class RecommendationSystem:
         #########self.cache_expiry = datetime.timedelta(hours=12)
         self.cache_expiry = datetime.timedelta(minutes=10)
         
+    @property
+    def db(self):
+        """Sesión del hilo actual (solo lecturas: se usa el motor de lectura/analítica)"""
+        session = getattr(self._local, "db", None)
+        if session is None:
+            session = self._local.db = ReadSessionLocal()
+        return session
+    
+    @db.setter
+    def db(self, session):
+        self._local.db = session
+    
     def _is_cache_valid(self):
         """Verifica si el caché es válido o ha expirado"""
         return (datetime.datetime.now() - self.last_cache_update) < self.cache_expiry
         
-    def _build_user_item_matrix(self) -> Tuple[np.ndarray, List[int], List[int]]:
-        """
-        Construye una matriz usuario-item basada en likes y visitas
-        
-        Returns:
-            Tuple[np.ndarray, List[int], List[int]]: La matriz, lista de IDs de usuarios, lista de IDs de posts
-        """
-        try:
-            # Obtener todos los usuarios y posts
-            users = self.db.query(User).all()
-            posts = self.db.query(Post).all()
-            
-            user_ids = [user.id for user in users]
-            post_ids = [post.id for post in posts]
-            
-            # Crear matriz de interacciones
-            matrix = np.zeros((len(user_ids), len(post_ids)))
-            
-            # Llenar la matriz con likes (peso 2) y visitas (peso 1)
-            for i, user_id in enumerate(user_ids):
-                # Obtener likes del usuario
-                likes = self.db.query(Like).filter(Like.user_id == user_id).all()
-                for like in likes:
-                    if like.post_id in post_ids:
-                        j = post_ids.index(like.post_id)
-                        matrix[i, j] += 2  # Peso mayor para likes
-                
-                # Obtener visitas del usuario
-                visits = self.db.query(Visit).filter(Visit.user_id == user_id).all()
-                for visit in visits:
-                    if visit.post_id in post_ids:
-                        j = post_ids.index(visit.post_id)
-                        matrix[i, j] += 1  # Peso menor para visitas
-            
-            return matrix, user_ids, post_ids
-        except Exception as e:
-            logger.error(f"Error al construir la matriz usuario-item: {e}")
-            return np.array([]), [], []
-    
-    def _apply_svd(self, matrix: np.ndarray, n_components: int = 10) -> np.ndarray:
-        """
-        Aplica SVD a la matriz usuario-item
-        
-        Args:
-            matrix (np.ndarray): Matriz usuario-item
-            n_components (int, optional): Número de componentes. Default es 10.
-            
-        Returns:
-            np.ndarray: Matriz reconstruida después de SVD
+    def _get_model(self) -> Optional[recommender_model.RecommenderModel]:
+        """Modelo entrenado por el scheduler (training.py).
+
+        Sin artefacto no se bloquea la petición entrenando: se lanza el entrenamiento en segundo
+        plano y, mientras tanto, se recomienda sin scores del modelo.
         """
-        if matrix.shape[0] < 2 or matrix.shape[1] < 2:
-            logger.warning("Matriz demasiado pequeña para SVD")
-            return matrix
-            
-        # Ajustar el número de componentes si es necesario
-        n_components = min(n_components, min(matrix.shape[0]-1, matrix.shape[1]-1))
-        
-        try:
-            # Aplicar SVD
-            svd = TruncatedSVD(n_components=n_components)
-            matrix_reduced = svd.fit_transform(matrix)
-            reconstructed_matrix = matrix_reduced @ svd.components_
-            return reconstructed_matrix
-        except Exception as e:
-            logger.error(f"Error al aplicar SVD: {e}")
-            return matrix
+        model = recommender_model.get_model()
+        if model is None:
+            training.request_training()
+        return model
     
     def get_recommendations_for_user(self, user_id: int, n_recommendations: int = 5) -> List[Dict]:
         """
-        Obtiene recomendaciones para un usuario basadas en sus interacciones
+        Obtiene recomendaciones para un usuario basadas en sus interacciones.
+        
+        Dos etapas: fuentes baratas de candidatos (candidate_sources: top del modelo, últimos
+        posts de las categorías preferidas, trending y populares) y reranking solo de esos
+        candidatos (score del modelo + bonus de categoría).
         
         Args:
             user_id (int): ID del usuario
@@ -117,114 +89,57 @@ class RecommendationSystem:
         """
         try:
             with self.db.begin():  # Iniciar transacción
-                # Verificar si hay recomendaciones en caché
-                if self._is_cache_valid() and user_id in self.user_based_recommendations_cache:
-                    return self.user_based_recommendations_cache[user_id][:n_recommendations]
-                
-                # Obtener las categorías preferidas del usuario basadas en sus interacciones
-                user_likes = self.db.query(Like).filter(Like.user_id == user_id).all()
-                user_visits = self.db.query(Visit).filter(Visit.user_id == user_id).all()
-                
-                interacted_post_ids = set([like.post_id for like in user_likes] + 
-                                        [visit.post_id for visit in user_visits])
+                # Verificar si hay recomendaciones en caché (calculadas con el modelo actual)
+                model = self._get_model()
+                model_version = model.trained_at if model is not None else None
+                cached = self.user_based_recommendations_cache.get(user_id)
+                if (self._is_cache_valid() and cached is not None and cached[0] == model_version
+                        and len(cached[1]) >= n_recommendations):
+                    return cached[1][:n_recommendations]
                 
-                # Si el usuario no ha interactuado con ningún post, devolver los posts populares
-                if not interacted_post_ids:
-                    logger.info(f"Usuario {user_id} no tiene interacciones, devolviendo posts populares")
-                    return self._get_popular_posts(n_recommendations)
+                # Leer las categorías preferidas directamente del perfil de afinidad
+                sorted_categories = crud.get_user_category_affinity(self.db, user_id)
                 
-                # Obtener las categorías de los posts con los que ha interactuado el usuario
-                interacted_posts = self.db.query(Post).filter(Post.id.in_(interacted_post_ids)).all()
+                # Si el usuario no tiene afinidad con ninguna categoría, devolver los posts populares
+                if not sorted_categories:
+                    logger.info(f"Usuario {user_id} no tiene perfil de afinidad, devolviendo posts populares")
+                    return self._popular_posts(n_recommendations)
                 
-                # Contar las interacciones por categoría
-                category_weights = defaultdict(int)
-                for post in interacted_posts:
-                    # Dar más peso a los likes (x3) que a las visitas (x1)
-                    like_weight = 3 if post.id in [like.post_id for like in user_likes] else 0
-                    visit_weight = 1 if post.id in [visit.post_id for visit in user_visits] else 0
-                    # like_weight = 3 if post.id in [like.post_id for like in user_likes] else 0
-                    # visit_weight = 1 if post.id in [visit.post_id for visit in user_visits] else 0
-                    category_weights[post.categorie] += (like_weight + visit_weight)
-                
-                # Ordenar categorías por peso
-                sorted_categories = sorted(category_weights.items(), key=lambda x: x[1], reverse=True)
                 logger.info(f"Categorías preferidas del usuario {user_id}: {sorted_categories}")
                 
-                # Si hay categorías preferidas, priorizar posts de esas categorías
-                if sorted_categories:
-                    # Obtener posts no interactuados de las categorías preferidas
-                    preferred_categories = [cat for cat, _ in sorted_categories]
-                    
-                    # Construir matriz usuario-item solo si es necesario para SVD
-                    matrix, user_ids, post_ids = self._build_user_item_matrix()
-                    
-                    if user_id in user_ids:
-                        # Aplicar SVD para obtener recomendaciones personalizadas
-                        reconstructed_matrix = self._apply_svd(matrix)
-                        user_idx = user_ids.index(user_id)
-                        user_scores = reconstructed_matrix[user_idx]
-                        
-                        # Obtener todos los posts no interactuados
-                        all_posts = self.db.query(Post).filter(~Post.id.in_(interacted_post_ids)).all()
-                        
-                        # Calcular puntuación combinada (SVD + categoría)
-                        post_scores = []
-                        for post in all_posts:
-                            if post.id in post_ids:
-                                post_idx = post_ids.index(post.id)
-                                svd_score = user_scores[post_idx]
-                                
-                                # Bonus por categoría preferida
-                                category_bonus = 0
-                                for i, (cat, _) in enumerate(sorted_categories):
-                                    if post.categorie == cat:
-                                        # Dar más peso a las categorías más preferidas
-                                        category_bonus = (len(sorted_categories) - i) / len(sorted_categories) * 5
-                                        break
-                                
-                                # Puntuación combinada
-                                combined_score = svd_score + category_bonus
-                                post_scores.append((post, combined_score))
-                        
-                        # Ordenar por puntuación combinada
-                        post_scores.sort(key=lambda x: x[1], reverse=True)
-                        recommended_posts = [ps[0] for ps in post_scores[:n_recommendations]]
-                    else:
-                        # Si el usuario no está en la matriz, recomendar por categoría
-                        recommended_posts = []
-                        remaining = n_recommendations
-                        
-                        # Distribuir recomendaciones entre categorías preferidas
-                        for category, _ in sorted_categories:
-                            if remaining <= 0:
-                                break
-                            
-                            # Obtener posts no interactuados de esta categoría
-                            category_posts = self.db.query(Post).filter(
-                                Post.categorie == category,
-                                ~Post.id.in_(interacted_post_ids)
-                            ).order_by(Post.created_at.desc()).limit(remaining).all()
-                            
-                            recommended_posts.extend(category_posts)
-                            remaining -= len(category_posts)
-                        
-                        # Si aún faltan recomendaciones, añadir posts populares
-                        if remaining > 0:
-                            popular_posts = self.db.query(Post).filter(
-                                ~Post.id.in_(interacted_post_ids),
-                                ~Post.id.in_([p.id for p in recommended_posts])
-                            ).order_by(Post.created_at.desc()).limit(remaining).all()
-                            
-                            recommended_posts.extend(popular_posts)
-                else:
-                    # Fallback a posts populares si no hay categorías preferidas
-                    return self._get_popular_posts(n_recommendations)
+                # Etapa 1: candidatos (sin los posts con los que el usuario ya ha interactuado)
+                with metrics.timer("recommendations.candidates_ms"):
+                    seen = seen_items.cache.get(self.db, user_id)
+                    user_scores = model.user_scores(user_id) if model is not None else None
+                    candidates = candidate_sources.generate(
+                        self.db, seen, [category_id for category_id, _ in sorted_categories], model, user_scores
+                    )
+                metrics.observe("recommendations.candidates", len(candidates))
+                
+                # Etapa 2: reranking de los candidatos
+                with metrics.timer("recommendations.rerank_ms"):
+                    category_by_post = dict(self.db.execute(
+                        select(Post.id, Post.category_id).where(Post.id.in_(candidates))
+                    ).all()) if candidates else {}
+                    candidates = [post_id for post_id in candidates if post_id in category_by_post]
+                    candidate_categories = np.array([category_by_post[post_id] or 0 for post_id in candidates], dtype=np.int64)
+                    category_bonus = recommendation_scoring.category_bonus(
+                        sorted_categories, int(candidate_categories.max(initial=0)) + 1
+                    )
+                    combined_scores = category_bonus[candidate_categories]
+                    if user_scores is not None:
+                        # Posts nuevos que el modelo aún no conoce: score 0
+                        positions, found = recommender_model.lookup(model.post_ids, np.array(candidates, dtype=np.int64))
+                        combined_scores[found] += user_scores[positions[found]]
+                    # A igual puntuación manda el orden de las fuentes
+                    order = np.argsort(-combined_scores, kind="stable")[:n_recommendations]
                 
                 # Convertir a formato de respuesta
-                recommendations = [self._post_to_dict(post) for post in recommended_posts]
+                with metrics.timer("recommendations.fetch_ms"):
+                    recommendations = self._posts_to_dicts([candidates[i] for i in order])
                 
                 # Guardar en caché
-                self.user_based_recommendations_cache[user_id] = recommendations
+                self.user_based_recommendations_cache[user_id] = (model_version, recommendations)
                 self.last_cache_update = datetime.datetime.now()
                 
                 return recommendations
@@ -232,11 +147,11 @@ class RecommendationSystem:
             logger.error(f"Error al obtener recomendaciones para el usuario {user_id}: {e}")
             # Crear una nueva sesión limpia en caso de error
             self.db.close()
-            self.db = SessionLocal()
+            self.db = ReadSessionLocal()
             # Fallback a posts populares en caso de error
             return self._get_popular_posts(n_recommendations)
     
-    def get_similar_posts(self, post_id: int, n_recommendations: int = 5) -> List[Dict]:
+    def get_similar_posts(self, post_id: int, n_recommendations: int = SIMILAR_POSTS_N) -> List[Dict]:
         """
         Obtiene posts similares a un post dado utilizando un enfoque híbrido
         que combina SVD, similitud de contenido y categorías
@@ -324,73 +239,40 @@ class RecommendationSystem:
                         logger.warning(f"Error al aplicar SVD para posts similares: {matrix_error}")
                 
                 # Enfoque 2: Similitud basada en características y contenido
-                # Crear DataFrame con características de los posts
-                posts_features = []
-                for p in [target_post] + all_posts:
-                    # Extraer características del post
-                    features = {
-                        'id': p.id,
-                        'categorie': p.categorie or "unknown",
-                        # Añadir más características para mejorar la similitud
-                        'title_length': len(p.title) if p.title else 0,
-                        'content_length': len(p.content) if p.content else 0,
-                    }
-                    posts_features.append(features)
+                try:
+                    # Características de los posts: one-hot de la categoría (ids enteros) + longitudes normalizadas
+                    candidates = [target_post] + all_posts
+                    category_ids = np.array([p.category_id or 0 for p in candidates], dtype=np.int64)
+                    lengths = np.array([[len(p.title) if p.title else 0, len(p.content) if p.content else 0]
+                                        for p in candidates], dtype=np.float64)
                 
-                # Convertir a DataFrame
-                posts_df = pd.DataFrame(posts_features)
+                    _, category_codes = np.unique(category_ids, return_inverse=True)
+                    categories_onehot = np.zeros((len(candidates), category_codes.max() + 1))
+                    categories_onehot[np.arange(len(candidates)), category_codes] = 1.0
+                    # Normalizar características numéricas (min-max)
+                    span = lengths.max(axis=0) - lengths.min(axis=0)
+                    lengths_scaled = (lengths - lengths.min(axis=0)) / np.where(span > 0, span, 1.0)
+                    features_matrix = np.hstack([categories_onehot, lengths_scaled])
+                
+                    # Similitud del post objetivo (fila 0) con todos los demás en una sola operación
+                    similarities = cosine_similarity(features_matrix[:1], features_matrix[1:])[0]
+                    order = np.argsort(-similarities, kind="stable")[:n_recommendations]
                 
-                # One-hot encoding de categorías
-                if 'categorie' in posts_df.columns:
-                    categories_dummies = pd.get_dummies(posts_df['categorie'])
-                    # Combinar con otras características numéricas
-                    numeric_features = posts_df[['title_length', 'content_length']]
-                    # Normalizar características numéricas
-                    from sklearn.preprocessing import MinMaxScaler
-                    scaler = MinMaxScaler()
-                    numeric_features_scaled = scaler.fit_transform(numeric_features)
-                    numeric_features_df = pd.DataFrame(
-                        numeric_features_scaled, 
-                        columns=['title_length_scaled', 'content_length_scaled'],
-                        index=posts_df.index
-                    )
-                    
-                    # Combinar todas las características
-                    features_matrix = pd.concat([categories_dummies, numeric_features_df], axis=1)
-                    
-                    # Calcular similitud
-                    post_idx = posts_df[posts_df['id'] == post_id].index[0]
-                    post_vector = features_matrix.iloc[post_idx].values.reshape(1, -1)
-                    
-                    similarities = []
-                    for i, p_id in enumerate(posts_df['id']):
-                        if p_id != post_id:
-                            other_vector = features_matrix.iloc[i].values.reshape(1, -1)
-                            sim = cosine_similarity(post_vector, other_vector)[0][0]
-                            similarities.append((p_id, sim))
-                    
-                    # Ordenar por similitud
-                    similarities.sort(key=lambda x: x[1], reverse=True)
-                    
-                    # Obtener los top n posts
-                    similar_post_ids = [s[0] for s in similarities[:n_recommendations]]
-                    
                     # Obtener detalles de los posts
-                    similar_posts = []
-                    for similar_id in similar_post_ids:
-                        similar_post = self.db.query(Post).filter(Post.id == similar_id).first()
-                        if similar_post:
-                            similar_posts.append(self._post_to_dict(similar_post))
-                    
+                    similar_posts = [self._post_to_dict(all_posts[i]) for i in order]
+                
                     # Guardar en caché
                     self.similar_posts_cache[post_id] = similar_posts
                     self.last_cache_update = datetime.datetime.now()
-                    
+                
                     return similar_posts
+                except Exception as feature_error:
+                    # Sigue con los enfoques 3 y 4
+                    logger.warning(f"Error al calcular la similitud por características: {feature_error}")
             
                 # Enfoque 3: Fallback a posts de la misma categoría
-                if target_post.categorie:
-                    category_posts = [p for p in all_posts if p.categorie == target_post.categorie]
+                if target_post.category_id:
+                    category_posts = [p for p in all_posts if p.category_id == target_post.category_id]
                     if category_posts:
                         # Tomar los primeros n posts de la misma categoría
                         similar_posts = category_posts[:n_recommendations]
@@ -412,35 +294,38 @@ class RecommendationSystem:
     def _get_popular_posts(self, n_posts: int = 5) -> List[Dict]:
         try:
             with self.db.begin():  # Iniciar transacción
-                # Obtener posts con conteo de likes y visitas
-                posts_with_stats = self.db.query(
-                    Post,
-                    func.count(Like.id).label('like_count'),
-                    func.count(Visit.id).label('visit_count')
-                ).outerjoin(
-                    Like, Post.id == Like.post_id
-                ).outerjoin(
-                    Visit, Post.id == Visit.post_id
-                ).group_by(
-                    Post.id
-                ).order_by(
-                    func.count(Like.id).desc(),
-                    func.count(Visit.id).desc()
-                ).limit(n_posts).all()
-                
-                # Convertir a formato de respuesta
-                popular_posts = []
-                for post, _, _ in posts_with_stats:
-                    popular_posts.append(self._post_to_dict(post))
-                
-                return popular_posts
-                
+                return self._popular_posts(n_posts)
         except Exception as e:
             logger.error(f"Error al obtener posts populares: {e}")
+            self.db.rollback()
             # Fallback: obtener los posts más recientes
             recent_posts = self.db.query(Post).order_by(Post.created_at.desc()).limit(n_posts).all()
             return [self._post_to_dict(post) for post in recent_posts]
     
+    def _popular_posts(self, n_posts: int) -> List[Dict]:
+        """Posts con más likes y visitas (lista cacheada en candidate_sources), dentro de la transacción en curso"""
+        return self._posts_to_dicts(candidate_sources.popular.get(self.db)[:n_posts])
+    
+    def _posts_to_dicts(self, post_ids: List[int]) -> List[Dict]:
+        """Como _post_to_dict para varios posts, con una consulta de posts y contadores agrupados"""
+        if not post_ids:
+            return []
+        posts = {post.id: post for post in self.db.query(Post).filter(Post.id.in_(post_ids))}
+        likes = dict(self.db.query(Like.post_id, func.count(Like.id))
+                     .filter(Like.post_id.in_(post_ids)).group_by(Like.post_id).all())
+        visits = dict(self.db.query(Visit.post_id, func.count(Visit.id))
+                      .filter(Visit.post_id.in_(post_ids)).group_by(Visit.post_id).all())
+        return [{
+            "id": post.id,
+            "title": post.title,
+            "content": post.content[:100] + "..." if len(post.content or "") > 100 else post.content,
+            "image": post.image,
+            "categorie": post.categorie,
+            "likes": likes.get(post.id, 0),
+            "visits": visits.get(post.id, 0),
+            "isliked": False
+        } for post in (posts.get(post_id) for post_id in post_ids) if post is not None]
+    
     def _post_to_dict(self, post, current_user = None) -> Dict:
         """Convierte un objeto Post a un diccionario"""
         # Asegurar que el id esté presente y sea un entero
@@ -460,7 +345,7 @@ class RecommendationSystem:
         return {
             "id": post_id,
             "title": post.title,
-            "content": post.content[:100] + "..." if len(post.content) > 100 else post.content,
+            "content": post.content[:100] + "..." if len(post.content or "") > 100 else post.content,
             "image": post.image,
             "categorie": post.categorie,
             "likes": self.db.query(models.Like).filter(models.Like.post_id == post.id).count(),
@@ -476,8 +361,10 @@ class RecommendationSystem:
         self.last_cache_update = datetime.datetime.now()
     
     def __del__(self):
-        """Cierra la sesión de la base de datos al destruir el objeto"""
-        self.db.close()
+        """Cierra la sesión de la base de datos del hilo actual al destruir el objeto"""
+        session = getattr(self._local, "db", None)
+        if session is not None:
+            session.close()
 
 # Instancia global del sistema de recomendación
 recommendation_system = RecommendationSystem()
\ No newline at end of file
@@ -0,0 +1,178 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+
+import crud
+import metrics
+import models
+import recommendation_scoring
+import recommender_model
+
+# Precálculo del top-N de recomendaciones de todos los usuarios (tabla user_recommendations)
+RECOMMENDATIONS_PRECOMPUTE_ENABLED = os.getenv("RECOMMENDATIONS_PRECOMPUTE_ENABLED", "1") == "1"
+RECOMMENDATIONS_TOP_N = int(os.getenv("RECOMMENDATIONS_TOP_N", "20"))
+# Filas de factores de usuario por bloque y procesos que puntúan los bloques
+RECOMMENDATIONS_BLOCK_SIZE = int(os.getenv("RECOMMENDATIONS_BLOCK_SIZE", "1024"))
+RECOMMENDATIONS_WORKERS = int(os.getenv("RECOMMENDATIONS_WORKERS", str(min(os.cpu_count() or 1, 4))))
+INSERT_CHUNK_SIZE = 5000
+
+logger = logging.getLogger("batch_recommendations")
+
+class SharedArrays:
+    """Copia arrays a memoria compartida para que los procesos del pool los lean sin serializarlos"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self._segments = []
+        self.spec = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            segment = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=segment.buf)[...] = array
+            self._segments.append(segment)
+            self.spec[name] = (segment.name, array.shape, array.dtype.str)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        for segment in self._segments:
+            segment.close()
+            segment.unlink()
+
+def _score_block_shared(spec: dict, start: int, end: int, n: int):
+    """Se ejecuta en un proceso del pool: puntúa un bloque leyendo los arrays compartidos"""
+    segments = {name: shared_memory.SharedMemory(name=shm_name) for name, (shm_name, _, _) in spec.items()}
+    arrays = {}
+    try:
+        for name, (_, shape, dtype) in spec.items():
+            arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=segments[name].buf)
+        top, scores = recommendation_scoring.score_users(start=start, end=end, n=n, **arrays)
+        return start, top, scores
+    finally:
+        # Soltar las vistas antes de cerrar los segmentos
+        arrays.clear()
+        for segment in segments.values():
+            segment.close()
+
+def _affinity_bonus(db: Session, model: recommender_model.RecommenderModel, n_categories: int):
+    """Matriz de bonus (usuarios del modelo x categorías) y máscara de usuarios con perfil"""
+    rows = db.execute(
+        select(models.UserCategoryAffinity.user_id, models.UserCategoryAffinity.category_id,
+               models.UserCategoryAffinity.score, models.UserCategoryAffinity.updated_at)
+        .where(models.UserCategoryAffinity.score > 0)
+    ).all()
+    now = datetime.now()
+    user_ids = np.array([row.user_id for row in rows], dtype=np.int64)
+    category_ids = np.array([row.category_id for row in rows], dtype=np.int64)
+    scores = np.array([row.score for row in rows]) * recommender_model.decay_factors(
+        recommender_model.to_datetime64([row.updated_at for row in rows]), now, crud.AFFINITY_HALF_LIFE_DAYS
+    )
+    user_rows, known = recommender_model.lookup(model.user_ids, user_ids)
+    known &= category_ids < n_categories
+    n_users = len(model.user_ids)
+    bonus = recommendation_scoring.category_bonus_matrix(
+        user_rows[known], category_ids[known], scores[known], n_users, n_categories
+    )
+    has_profile = np.bincount(user_rows[known], minlength=n_users) > 0
+    return bonus, has_profile
+
+def _replace_users(db: Session, user_ids, rows) -> int:
+    """Sustituye las filas de esos usuarios en una transacción corta"""
+    if not user_ids:
+        return 0
+    db.execute(delete(models.UserRecommendation).where(models.UserRecommendation.user_id.in_(user_ids)))
+    if rows:
+        db.execute(insert(models.UserRecommendation), rows)
+    db.commit()
+    return len(rows)
+
+def precompute_recommendations(db: Session, model: recommender_model.RecommenderModel,
+                               data: recommender_model.InteractionMatrix, top_n: int = RECOMMENDATIONS_TOP_N,
+                               workers: int = RECOMMENDATIONS_WORKERS,
+                               block_size: int = RECOMMENDATIONS_BLOCK_SIZE) -> int:
+    """Calcula el top-N de todos los usuarios con perfil de afinidad y reemplaza user_recommendations.
+
+    Las filas se sustituyen por tandas de usuarios, cada una en su propia transacción: la tabla
+    nunca queda vacía y los endpoints siguen leyendo el lote anterior hasta que llega el nuevo.
+
+    model y data deben estar alineados (mismos user_ids/post_ids): data aporta los posts ya
+    vistos, que se excluyen. Devuelve el número de filas escritas.
+    """
+    start_time = time.perf_counter()
+    post_rows = db.execute(select(models.Post.id, models.Post.category_id)).all()
+    category_by_post = {post_id: category_id or 0 for post_id, category_id in post_rows}
+    post_categories = np.array([category_by_post.get(int(pid), 0) for pid in model.post_ids], dtype=np.int64)
+    max_category = db.execute(select(models.Category.id).order_by(models.Category.id.desc()).limit(1)).scalar()
+    n_categories = max(int(post_categories.max(initial=0)), max_category or 0) + 1
+    bonus, has_profile = _affinity_bonus(db, model, n_categories)
+
+    arrays = {
+        "user_factors": model.user_factors.astype(np.float32),
+        "item_factors": model.item_factors.astype(np.float32),
+        "seen_indptr": data.matrix.indptr.astype(np.int64),
+        "seen_indices": data.matrix.indices.astype(np.int64),
+        "bonus": bonus,
+        "post_categories": post_categories,
+    }
+    n_users = len(model.user_ids)
+    blocks = [(start, min(start + block_size, n_users)) for start in range(0, n_users, block_size)]
+    if workers <= 1 or len(blocks) <= 1:
+        results = [(start,) + recommendation_scoring.score_users(start=start, end=end, n=top_n, **arrays)
+                   for start, end in blocks]
+    else:
+        with SharedArrays(arrays) as shared, ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_score_block_shared, shared.spec, start, end, top_n) for start, end in blocks]
+            results = [future.result() for future in futures]
+    score_ms = (time.perf_counter() - start_time) * 1000
+
+    generated_at = datetime.now()
+    n_rows = 0
+    chunk_users, chunk_rows = [], []
+    for start, top, scores in results:
+        for offset in range(top.shape[0]):
+            user_row = start + offset
+            # Sin perfil de afinidad no se precalcula: el endpoint devuelve los populares
+            if not has_profile[user_row]:
+                continue
+            user_id = int(model.user_ids[user_row])
+            chunk_users.append(user_id)
+            rank = 0
+            for post_idx, score in zip(top[offset], scores[offset]):
+                if not np.isfinite(score):
+                    break
+                chunk_rows.append({"user_id": user_id, "rank": rank, "post_id": int(model.post_ids[post_idx]),
+                                   "score": float(score), "generated_at": generated_at})
+                rank += 1
+            if len(chunk_rows) >= INSERT_CHUNK_SIZE:
+                n_rows += _replace_users(db, chunk_users, chunk_rows)
+                chunk_users, chunk_rows = [], []
+    n_rows += _replace_users(db, chunk_users, chunk_rows)
+    # Filas de lotes anteriores que este no ha reemplazado (usuarios que ya no tienen perfil)
+    db.execute(delete(models.UserRecommendation).where(models.UserRecommendation.generated_at < generated_at))
+    db.commit()
+
+    total_ms = (time.perf_counter() - start_time) * 1000
+    metrics.observe("recommendations.precompute_ms", total_ms)
+    metrics.set_gauge("recommendations.precomputed_rows", n_rows)
+    logger.info(f"Recomendaciones precalculadas: {n_rows} filas para {int(has_profile.sum())} usuarios "
+                f"({len(blocks)} bloques, puntuación {score_ms:.0f} ms, total {total_ms:.0f} ms)")
+    return n_rows
+
+def run_batch(db: Session, model: Optional[recommender_model.RecommenderModel] = None) -> int:
+    """Precalcula con el modelo publicado, alineándolo (fold-in) con los datos actuales si hace falta"""
+    model = model or recommender_model.get_model()
+    if model is None:
+        logger.warning("No hay modelo entrenado: no se precalculan recomendaciones")
+        return 0
+    data = recommender_model.build_interaction_matrix(db)
+    if not (np.array_equal(model.user_ids, data.user_ids) and np.array_equal(model.post_ids, data.post_ids)):
+        model = recommender_model.fold_in(model, data)
+    return precompute_recommendations(db, model, data)
@@ -0,0 +1,140 @@
+"""Benchmark de los motores del recomendador (TruncatedSVD vs ALS implícito) sobre los mismos datos.
+
+Para cada usuario con al menos dos interacciones se reserva una al azar; se entrena con el
+resto y se mide el tiempo de ajuste y la calidad del ranking (HR@k y NDCG@k) de la reservada.
+También compara el tiempo de ALS resolviendo fila a fila o con las resoluciones apiladas por bloque.
+
+Uso: python bench_recommender.py [--synthetic] [--users 2000] [--posts 500] [--k 10] [--threads 8]
+Sin --synthetic usa la base de datos configurada (DATABASE_URL / READ_DATABASE_URL).
+"""
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+
+import recommender_model
+
+def synthetic_matrix(n_users: int, n_posts: int, n_topics: int = 20, per_user: int = 15, seed: int = 0):
+    """Usuarios con afinidad por unos pocos temas: visitas (1) y likes (2) concentrados en ellos"""
+    rng = np.random.default_rng(seed)
+    post_topics = rng.integers(0, n_topics, n_posts)
+    rows, cols, weights = [], [], []
+    for user in range(n_users):
+        topics = rng.choice(n_topics, size=2, replace=False)
+        candidates = np.flatnonzero(np.isin(post_topics, topics))
+        noise = rng.integers(0, n_posts, max(per_user // 5, 1))
+        chosen = np.concatenate([rng.choice(candidates, size=min(per_user, len(candidates)), replace=False), noise])
+        rows.extend([user] * len(chosen))
+        cols.extend(chosen)
+        weights.extend(rng.choice([1.0, 2.0], size=len(chosen), p=[0.7, 0.3]))
+    matrix = sparse.coo_matrix((weights, (rows, cols)), shape=(n_users, n_posts)).tocsr()
+    return recommender_model.InteractionMatrix(
+        matrix, np.arange(1, n_users + 1), np.arange(1, n_posts + 1), 0, 0
+    )
+
+def database_matrix():
+    from database import ReadSessionLocal
+    with ReadSessionLocal() as db:
+        return recommender_model.build_interaction_matrix(db)
+
+def holdout_split(data: recommender_model.InteractionMatrix, seed: int = 0):
+    """Quita una interacción al azar de cada usuario con al menos dos; devuelve (train, {fila: columna})"""
+    rng = np.random.default_rng(seed)
+    matrix = data.matrix.tolil(copy=True)
+    held_out = {}
+    for row in range(matrix.shape[0]):
+        cols = matrix.rows[row]
+        if len(cols) < 2:
+            continue
+        col = cols[rng.integers(len(cols))]
+        held_out[row] = col
+        matrix[row, col] = 0
+    train = matrix.tocsr()
+    train.eliminate_zeros()
+    return recommender_model.InteractionMatrix(train, data.user_ids, data.post_ids, 0, 0), held_out
+
+def _solve_rows_loop(matrix, fixed, outer, gram, reg, alpha, out, start, end):
+    """Referencia: una resolución np.linalg.solve por fila en un bucle Python (implementación anterior)"""
+    k = fixed.shape[1]
+    regularized = gram + reg * np.eye(k)
+    indptr, indices, data = matrix.indptr, matrix.indices, matrix.data
+    for row in range(start, end):
+        lo, hi = indptr[row], indptr[row + 1]
+        if lo == hi:
+            out[row] = 0.0
+            continue
+        factors = fixed[indices[lo:hi]]
+        confidence = alpha * data[lo:hi]
+        a = regularized + (factors.T * confidence) @ factors
+        out[row] = np.linalg.solve(a, factors.T @ (1.0 + confidence))
+
+def als_speedup(train: recommender_model.InteractionMatrix, threads: int, repeat: int):
+    """Tiempo de fit_als con el bucle por fila y con la resolución apilada, en 1 y en `threads` hilos"""
+    batched = recommender_model._als_solve_rows
+    timings = {}
+    for label, solver in (("bucle por fila", _solve_rows_loop), ("apilado", batched)):
+        recommender_model._als_solve_rows = solver
+        try:
+            for n_threads in sorted({1, threads}):
+                best = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    recommender_model.fit_als(train, threads=n_threads)
+                    best = min(best, (time.perf_counter() - start) * 1000)
+                timings[(label, n_threads)] = best
+        finally:
+            recommender_model._als_solve_rows = batched
+    return timings
+
+def ranking_quality(model, train: sparse.csr_matrix, held_out: dict, k: int):
+    hits, ndcg = 0, 0.0
+    scores = model.user_factors @ model.item_factors.T
+    for row, col in held_out.items():
+        user_scores = scores[row].copy()
+        user_scores[train.indices[train.indptr[row]:train.indptr[row + 1]]] = -np.inf  # ya vistos
+        top = np.argpartition(-user_scores, k)[:k]
+        top = top[np.argsort(-user_scores[top])]
+        position = np.flatnonzero(top == col)
+        if len(position):
+            hits += 1
+            ndcg += 1.0 / np.log2(position[0] + 2)
+    n = max(len(held_out), 1)
+    return hits / n, ndcg / n
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--synthetic", action="store_true", help="Datos sintéticos en lugar de la BD")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=recommender_model.RECOMMENDER_ALS_THREADS,
+                        help="Hilos de ALS para la comparación de aceleración")
+    args = parser.parse_args()
+
+    data = synthetic_matrix(args.users, args.posts) if args.synthetic else database_matrix()
+    train, held_out = holdout_split(data)
+    print(f"Matriz {data.matrix.shape[0]} usuarios x {data.matrix.shape[1]} posts, "
+          f"{data.matrix.nnz} interacciones, {len(held_out)} reservadas")
+    print(f"\n{'motor':<6} {'ajuste (ms)':>12} {'HR@' + str(args.k):>8} {'NDCG@' + str(args.k):>9}")
+    for engine in recommender_model.ENGINES:
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            model = recommender_model.fit_model(train, engine)
+            best = min(best, (time.perf_counter() - start) * 1000)
+        if model is None:
+            print(f"{engine:<6} matriz demasiado pequeña")
+            continue
+        hr, ndcg = ranking_quality(model, train.matrix, held_out, args.k)
+        print(f"{engine:<6} {best:>12.1f} {hr:>8.3f} {ndcg:>9.3f}")
+
+    timings = als_speedup(train, args.threads, args.repeat)
+    reference = timings[("bucle por fila", 1)]
+    print(f"\n{'ALS':<16} {'hilos':>5} {'ajuste (ms)':>12} {'aceleración':>12}")
+    for (label, n_threads), ms in timings.items():
+        print(f"{label:<16} {n_threads:>5} {ms:>12.1f} {reference / ms:>11.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Benchmark de serialización y tamaño en red de las respuestas más grandes.
+
+Compara la ruta por defecto de FastAPI (jsonable_encoder + json.dumps) con orjson
+y mide los bytes enviados sin comprimir, con gzip y con Brotli (si está instalado).
+
+Uso: python bench_serialization.py [--repeat 20] [--posts-copies 5]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+
+import responses
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ARTICLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_articles")
+
+def load_articles():
+    try:
+        import markdown
+        to_html = markdown.markdown
+    except ImportError:
+        to_html = lambda text: text
+    articles = []
+    for filename in sorted(os.listdir(ARTICLE_DIR)):
+        if not filename.endswith(".json"):
+            continue
+        with open(os.path.join(ARTICLE_DIR, filename), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        articles.append({"title": data["titre"], "content": to_html(data["contenu"]), "categorie": data["categorie"]})
+    return articles
+
+def build_posts_payload(articles, copies: int):
+    """Equivalente a GET /api/posts: todos los posts con su contenido HTML completo"""
+    now = datetime.now()
+    posts = []
+    for i in range(copies):
+        for j, article in enumerate(articles):
+            post_id = i * len(articles) + j + 1
+            posts.append({
+                "id": post_id,
+                "user_id": 1,
+                "title": article["title"],
+                "content": article["content"],
+                "categorie": article["categorie"],
+                "image": "/media/default.jpg",
+                "created_at": now - timedelta(minutes=post_id),
+                "likes": random.randint(0, 50),
+                "visits": random.randint(0, 500),
+                "isliked": False,
+            })
+    return posts
+
+def build_power_bi_payload(n_users=300, n_posts=200, n_likes=3000, n_visits=20000):
+    """Equivalente a /api/users/analytics/power-bi"""
+    now = datetime.now()
+    return {
+        "users": [{"id": i, "username": f"user{i}", "email": f"user{i}@example.com", "is_admin": False,
+                   "created_at": now, "posts_count": 0, "likes_given": 10, "visits_count": 60}
+                  for i in range(n_users)],
+        "posts": [{"id": i, "title": f"Post {i}", "categorie": "Génie Civil", "user_id": 1,
+                   "created_at": now, "likes_count": 15, "visits_count": 100} for i in range(n_posts)],
+        "likes": [{"id": i, "user_id": i % n_users, "post_id": i % n_posts,
+                   "created_at": now - timedelta(days=i % 180)} for i in range(n_likes)],
+        "visits": [{"id": i, "user_id": i % n_users, "post_id": i % n_posts, "ip_address": "10.0.0.1",
+                    "visit_date": now - timedelta(days=i % 180)} for i in range(n_visits)],
+        "generated_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def fastapi_default(payload) -> bytes:
+    # Lo que hace JSONResponse de FastAPI/Starlette
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+def time_ms(func, payload, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payload)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+def report(name, payload, repeat: int):
+    before = fastapi_default(payload)
+    after = responses.dumps(payload)
+    print(f"\n=== {name} ===")
+    print(f"  serialización  json+jsonable_encoder: {time_ms(fastapi_default, payload, repeat):8.2f} ms")
+    print(f"  serialización  orjson:                {time_ms(responses.dumps, payload, repeat):8.2f} ms")
+    print(f"  bytes sin comprimir: {len(before):>10,} (json)  {len(after):>10,} (orjson)")
+    print(f"  bytes gzip (nivel {responses.GZIP_COMPRESS_LEVEL}): {len(gzip.compress(after, responses.GZIP_COMPRESS_LEVEL)):>10,}")
+    if brotli is not None:
+        print(f"  bytes brotli (q={responses.BROTLI_QUALITY}):  {len(brotli.compress(after, quality=responses.BROTLI_QUALITY)):>10,}")
+    else:
+        print("  brotli no instalado (pip install brotli-asgi)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--posts-copies", type=int, default=5, help="Multiplica el corpus de artículos")
+    args = parser.parse_args()
+
+    random.seed(0)
+    articles = load_articles()
+    report(f"GET /api/posts ({len(articles) * args.posts_copies} posts)",
+           build_posts_payload(articles, args.posts_copies), args.repeat)
+    report("GET /api/users/analytics/power-bi", build_power_bi_payload(), args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import func, literal, select, union_all
+from sqlalchemy.orm import Session
+
+import models
+import recommender_model
+import seen_items
+
+# Generación de candidatos para las recomendaciones: fuentes baratas que devuelven unos cientos
+# de posts; el reranking (RecommendationSystem) solo puntúa esos, no el catálogo entero
+CANDIDATES_MODEL = int(os.getenv("RECOMMENDATIONS_CANDIDATES_MODEL", "200"))
+CANDIDATES_PER_CATEGORY = int(os.getenv("RECOMMENDATIONS_CANDIDATES_PER_CATEGORY", "50"))
+CANDIDATES_TRENDING = int(os.getenv("RECOMMENDATIONS_CANDIDATES_TRENDING", "100"))
+CANDIDATES_POPULAR = int(os.getenv("RECOMMENDATIONS_CANDIDATES_POPULAR", "100"))
+TRENDING_WINDOW_HOURS = int(os.getenv("TRENDING_WINDOW_HOURS", "48"))
+# Las listas se recargan de la BD cada CANDIDATE_SOURCES_TTL segundos (posts de otros procesos)
+CANDIDATE_SOURCES_TTL = int(os.getenv("CANDIDATE_SOURCES_TTL", "300"))
+
+class CachedList:
+    """Lista de ids calculada con una consulta y recargada pasado el TTL. Segura entre hilos"""
+
+    def __init__(self, loader, ttl: int = CANDIDATE_SOURCES_TTL):
+        self._loader = loader
+        self.ttl = ttl
+        self._ids: Optional[List[int]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db: Session) -> List[int]:
+        with self._lock:
+            if self._ids is not None and time.monotonic() - self._loaded_at <= self.ttl:
+                return self._ids
+        ids = self._loader(db)
+        with self._lock:
+            self._ids, self._loaded_at = ids, time.monotonic()
+        return ids
+
+    def peek(self) -> Optional[List[int]]:
+        """Última lista cargada aunque haya caducado (None si nunca se cargó); no consulta la BD"""
+        return self._ids
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+class LatestByCategory:
+    """Últimos CANDIDATES_PER_CATEGORY posts de cada categoría (del más nuevo al más antiguo).
+
+    Se carga con una sola consulta (ROW_NUMBER por categoría) y crud.create_post la mantiene al día.
+    """
+
+    def __init__(self, size: int = CANDIDATES_PER_CATEGORY, ttl: int = CANDIDATE_SOURCES_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lists: Optional[Dict[int, List[int]]] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session) -> Dict[int, List[int]]:
+        ranked = select(
+            models.Post.id, models.Post.category_id,
+            func.row_number().over(
+                partition_by=models.Post.category_id,
+                order_by=(models.Post.created_at.desc(), models.Post.id.desc()),
+            ).label("position"),
+        ).where(models.Post.category_id.isnot(None)).subquery()
+        rows = db.execute(
+            select(ranked.c.category_id, ranked.c.id)
+            .where(ranked.c.position <= self.size)
+            .order_by(ranked.c.category_id, ranked.c.position)
+        ).all()
+        lists: Dict[int, List[int]] = {}
+        for category_id, post_id in rows:
+            lists.setdefault(category_id, []).append(post_id)
+        return lists
+
+    def get(self, db: Session, category_ids: Iterable[int]) -> List[int]:
+        """Ids de las categorías pedidas, concatenados en el orden de category_ids"""
+        with self._lock:
+            lists = self._lists if time.monotonic() - self._loaded_at <= self.ttl else None
+        if lists is None:
+            lists = self._load(db)
+            with self._lock:
+                self._lists, self._loaded_at = lists, time.monotonic()
+        return [post_id for category_id in category_ids for post_id in lists.get(category_id, ())]
+
+    def peek(self, category_ids: Iterable[int]) -> Optional[List[int]]:
+        """Como get pero sin consultar la BD: None si nunca se cargó"""
+        lists = self._lists
+        if lists is None:
+            return None
+        return [post_id for category_id in category_ids for post_id in lists.get(category_id, ())]
+
+    def add_post(self, post_id: int, category_id: Optional[int]):
+        if not category_id:
+            return
+        with self._lock:
+            if self._lists is not None:
+                # Lista nueva en vez de modificarla: los lectores la recorren fuera del lock
+                self._lists[category_id] = ([post_id] + self._lists.get(category_id, []))[:self.size]
+
+def _load_popular(db: Session) -> List[int]:
+    """Más likes y, a igualdad, más visitas (agregados por separado: sin producto likes x visitas)"""
+    likes = select(models.Like.post_id, func.count().label("n")).group_by(models.Like.post_id).subquery()
+    visits = select(models.Visit.post_id, func.count().label("n")).group_by(models.Visit.post_id).subquery()
+    return list(db.execute(
+        select(models.Post.id)
+        .outerjoin(likes, likes.c.post_id == models.Post.id)
+        .outerjoin(visits, visits.c.post_id == models.Post.id)
+        .order_by(func.coalesce(likes.c.n, 0).desc(), func.coalesce(visits.c.n, 0).desc(), models.Post.id.desc())
+        .limit(CANDIDATES_POPULAR)
+    ).scalars().all())
+
+def _load_trending(db: Session) -> List[int]:
+    """Más interacciones ponderadas (like > visita) en las últimas TRENDING_WINDOW_HOURS"""
+    since = datetime.now() - timedelta(hours=TRENDING_WINDOW_HOURS)
+    recent = union_all(
+        select(models.Like.post_id, literal(recommender_model.LIKE_WEIGHT).label("weight"))
+        .where(models.Like.created_at >= since),
+        select(models.Visit.post_id, literal(recommender_model.VISIT_WEIGHT).label("weight"))
+        .where(models.Visit.visit_date >= since),
+    ).subquery()
+    total = func.sum(recent.c.weight)
+    return list(db.execute(
+        select(recent.c.post_id).group_by(recent.c.post_id)
+        .order_by(total.desc(), recent.c.post_id.desc())
+        .limit(CANDIDATES_TRENDING)
+    ).scalars().all())
+
+latest_by_category = LatestByCategory()
+popular = CachedList(_load_popular)
+trending = CachedList(_load_trending)
+
+def model_candidates(model: recommender_model.RecommenderModel, user_scores: np.ndarray,
+                     seen: np.ndarray, k: int = CANDIDATES_MODEL) -> List[int]:
+    """Los k posts mejor puntuados por el modelo, sin los ya vistos"""
+    scores = np.where(seen_items.contains(seen, model.post_ids), -np.inf, user_scores)
+    k = min(k, len(scores))
+    if k <= 0:
+        return []
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.isfinite(scores[top])]
+    return model.post_ids[top].tolist()
+
+def load_all(db: Session):
+    """Carga (o recarga si caducaron) las listas en memoria de las fuentes"""
+    latest_by_category.get(db, ())
+    trending.get(db)
+    popular.get(db)
+
+def _merge(sources: List[Iterable[int]], seen: np.ndarray) -> List[int]:
+    candidates = np.fromiter((post_id for source in sources for post_id in source), dtype=np.int64)
+    # Sin repetidos (se queda la primera aparición) y sin vistos, filtrando en numpy
+    _, first = np.unique(candidates, return_index=True)
+    candidates = candidates[np.sort(first)]
+    return candidates[~seen_items.contains(seen, candidates)].tolist()
+
+def heuristic(seen: np.ndarray, preferred_categories: List[int], n: int) -> Optional[List[int]]:
+    """Nivel instantáneo, solo con las listas en memoria: últimos posts de las categorías preferidas
+    (en orden de preferencia), trending y populares. None si las listas aún no se han cargado
+    """
+    latest, trending_ids, popular_ids = latest_by_category.peek(preferred_categories), trending.peek(), popular.peek()
+    if latest is None or trending_ids is None or popular_ids is None:
+        return None
+    return _merge([latest, trending_ids, popular_ids], seen)[:n]
+
+def generate(db: Session, seen: np.ndarray, preferred_categories: List[int],
+             model: Optional[recommender_model.RecommenderModel] = None,
+             user_scores: Optional[np.ndarray] = None) -> List[int]:
+    """Candidatos sin repetir ni vistos, por orden de fuente: modelo, categorías preferidas, trending, populares"""
+    sources = []
+    if model is not None and user_scores is not None:
+        sources.append(model_candidates(model, user_scores, seen))
+    sources.append(latest_by_category.get(db, preferred_categories))
+    sources.append(trending.get(db))
+    sources.append(popular.get(db))
+    return _merge(sources, seen)
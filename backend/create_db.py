@@ -1,10 +1,110 @@
-from database import Base, engine
+from sqlalchemy import inspect, text
+from database import Base, engine, SessionLocal, ensure_database
 import models
+import crud
+
+def drop_legacy_affinity_table() -> bool:
+    # El perfil de afinidad pasó de (user_id, categorie) a (user_id, category_id): es un dato
+    # derivado, así que la tabla antigua se elimina y se reconstruye desde el historial
+    inspector = inspect(engine)
+    table = models.UserCategoryAffinity.__tablename__
+    if not inspector.has_table(table):
+        return False
+    if "category_id" in {col["name"] for col in inspector.get_columns(table)}:
+        return False
+    models.UserCategoryAffinity.__table__.drop(bind=engine)
+    print(f"Tabla antigua eliminada: {table}")
+    return True
 
 def create_tables():
     print("Creando tablas en la base de datos...")
     Base.metadata.create_all(bind=engine)
     print("¡Tablas creadas exitosamente!")
 
-if __name__ == "__main__":
+def add_missing_columns():
+    # create_all no modifica tablas existentes: añadir las columnas (e índices) nuevas de los modelos
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {col["name"] for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"Columna añadida: {table.name}.{column.name}")
+                for index in table.indexes:
+                    if column.name in index.columns:
+                        index.create(bind=conn)
+
+def add_missing_indexes():
+    # Crear los índices declarados en los modelos que aún no existen en tablas ya creadas
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                print(f"Índice creado: {index.name}")
+
+def backfill_user_lookup():
+    # Rellenar las columnas normalizadas de login de los usuarios existentes
+    db = SessionLocal()
+    try:
+        users = db.query(models.User).filter(
+            (models.User.username_lookup == None) | (models.User.email_lookup == None)
+        ).all()
+        for user in users:
+            user.username_lookup = crud.normalize_login(user.username)
+            user.email_lookup = crud.normalize_login(user.email)
+        db.commit()
+        print(f"Usuarios normalizados: {len(users)}")
+    finally:
+        db.close()
+
+def backfill_post_categories():
+    # Canonicalizar las categorías de texto libre de los posts y enlazarlas con la tabla categories
+    db = SessionLocal()
+    try:
+        names = [name for (name,) in db.query(models.Post.categorie)
+                 .filter(models.Post.category_id == None, models.Post.categorie != None).distinct()]
+        for name in names:
+            category = crud.get_or_create_category(db, name)
+            if category is None:
+                continue
+            db.query(models.Post).filter(models.Post.category_id == None, models.Post.categorie == name)\
+              .update({models.Post.category_id: category.id, models.Post.categorie: category.name},
+                      synchronize_session=False)
+        db.commit()
+        print(f"Categorías de posts normalizadas: {len(names)} variantes")
+    finally:
+        db.close()
+
+def backfill_category_affinity():
+    # Construir los perfiles de afinidad a partir del historial existente
+    db = SessionLocal()
+    try:
+        total = crud.rebuild_category_affinity(db)
+        print(f"Perfiles de afinidad reconstruidos: {total} entradas")
+    finally:
+        db.close()
+
+def init_db():
+    # Bootstrap del esquema: se llama al arrancar la API (lifespan) y desde este script
+    ensure_database()
+    rebuild_affinity = drop_legacy_affinity_table()
     create_tables()
+    add_missing_columns()
+    add_missing_indexes()
+    backfill_user_lookup()
+    backfill_post_categories()
+    if rebuild_affinity:
+        backfill_category_affinity()
+
+if __name__ == "__main__":
+    init_db()
+    backfill_category_affinity()
@@ -1,15 +1,36 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
+from sqlalchemy import DateTime, Float, case, func, literal, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+import os
+import re
+import threading
+import time
+import unicodedata
 import models, schemas
+import search_index
+import candidate_sources
+import seen_items
+import recommender_model
+import numpy as np
 
 # ====== USERS ======
-def create_user(db: Session, user: schemas.UserCreate):
-    # تشفير كلمة المرور قبل حفظها
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: schemas.UserCreate, hashed_password: str = None):
+    # تشفير كلمة المرور قبل حفظها (si no se ha hecho ya en el executor de hashing)
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     new_user = models.User(
         username=user.username,
         fullName=user.fullName,
         email=user.email,
+        username_lookup=normalize_login(user.username),
+        email_lookup=normalize_login(user.email),
         password=hashed_password,  # كلمة المرور مشفرة الآن
         is_admin=user.is_admin  # Asignar el valor de is_admin del esquema
     )
@@ -29,16 +50,23 @@ def get_user_by_email(db: Session, email: str):
 
 # ====== POSTS ======
 def create_post(db: Session, post: schemas.PostCreate, user_id: int):
+    category = get_or_create_category(db, post.categorie)
     new_post = models.Post(
         title=post.title,
         content=post.content,
         user_id=user_id,
         image=post.image,
-        categorie=post.categorie
+        categorie=category.name if category else None,
+        category_id=category.id if category else None
     )
     db.add(new_post)
     db.commit()
     db.refresh(new_post)
+    if category:
+        remember_categories([(category.id, category.name, category_slug(category.name))])
+    search_index.index.add_post(new_post.id, new_post.title, new_post.content)
+    candidate_sources.latest_by_category.add_post(new_post.id, new_post.category_id)
+    bump_category_count(new_post.category_id)
     return new_post
 
 def get_posts(db: Session, current_user_id=None):
@@ -106,13 +134,112 @@ def get_user_posts(db: Session, user_id: int):
     
     return result
 
+# ====== CATEGORÍAS ======
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'", "ʼ": "'", "´": "'", "`": "'"})
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+class CategoryRef(NamedTuple):
+    id: int
+    name: str
+
+def canonical_category(name: str) -> Optional[str]:
+    """Nombre canónico: NFC, apóstrofo recto y espacios simples"""
+    if not name:
+        return None
+    name = " ".join(unicodedata.normalize("NFC", name).translate(_APOSTROPHES).split())
+    return name or None
+
+def category_slug(name: str) -> str:
+    # "Sécurité des Systèmes d’Information" -> "securite-des-systemes-d-information"
+    return _SLUG_RE.sub("-", search_index.fold(canonical_category(name) or "")).strip("-")
+
+# Caché en memoria de la tabla categories (pequeña y casi inmutable)
+_categories_by_slug: Dict[str, CategoryRef] = {}
+_category_names: Dict[int, str] = {}
+_categories_lock = threading.Lock()
+
+def remember_categories(rows):
+    """Añade filas (id, name, slug) a la caché"""
+    with _categories_lock:
+        for category_id, name, slug in rows:
+            _categories_by_slug[slug] = CategoryRef(category_id, name)
+            _category_names[category_id] = name
+
+def cached_category(name: str) -> Optional[CategoryRef]:
+    return _categories_by_slug.get(category_slug(name))
+
+def get_category_names(db: Session, category_ids=()) -> Dict[int, str]:
+    """{id: nombre} de las categorías; se recarga si falta alguna de las pedidas"""
+    if not _category_names or any(category_id not in _category_names for category_id in category_ids):
+        remember_categories(db.query(models.Category.id, models.Category.name, models.Category.slug).all())
+    return _category_names
+
+def get_or_create_category(db: Session, name: str) -> Optional[CategoryRef]:
+    """Canonicaliza el nombre y devuelve su categoría, creándola si no existe (sin commit ni caché)"""
+    slug = category_slug(name)
+    if not slug:
+        return None
+    category = _categories_by_slug.get(slug)
+    if category is not None:
+        return category
+    row = db.query(models.Category).filter(models.Category.slug == slug).first()
+    if row is None:
+        row = models.Category(name=canonical_category(name), slug=slug)
+        try:
+            with db.begin_nested():
+                db.add(row)
+        except IntegrityError:
+            # Otra petición la creó a la vez
+            row = db.query(models.Category).filter(models.Category.slug == slug).one()
+    # Sin caché aquí: la fila puede ser de esta transacción, que aún puede deshacerse.
+    # El llamador la añade con remember_categories después del commit
+    return CategoryRef(row.id, row.name)
+
+# Conteo de posts por categoría mantenido en memoria; se recalcula al caducar
+# (otros procesos también crean posts)
+CATEGORY_COUNTS_TTL = int(os.getenv("CATEGORY_COUNTS_TTL", "300"))
+
+_category_counts: Optional[Dict[int, int]] = None
+_category_counts_loaded_at = 0.0
+_category_counts_lock = threading.Lock()
+
+def cached_category_counts() -> Optional[List[dict]]:
+    """[{id, categorie, count}] ordenado por número de posts; None si hay que recalcularlo"""
+    with _category_counts_lock:
+        if _category_counts is None or time.monotonic() - _category_counts_loaded_at > CATEGORY_COUNTS_TTL:
+            return None
+        counts = dict(_category_counts)
+    items = sorted(((_category_names.get(category_id, ""), category_id, count)
+                    for category_id, count in counts.items()), key=lambda item: (-item[2], item[0]))
+    return [{"id": category_id, "categorie": name, "count": count} for name, category_id, count in items]
+
+def set_category_counts(rows):
+    """Sustituye la caché con filas (id, name, slug, count) de un GROUP BY"""
+    global _category_counts, _category_counts_loaded_at
+    rows = list(rows)
+    remember_categories([(category_id, name, slug) for category_id, name, slug, _ in rows])
+    with _category_counts_lock:
+        _category_counts = {category_id: count for category_id, _, _, count in rows if count}
+        _category_counts_loaded_at = time.monotonic()
+
+def bump_category_count(category_id: int, delta: int = 1):
+    if not category_id:
+        return
+    with _category_counts_lock:
+        if _category_counts is not None:
+            _category_counts[category_id] = _category_counts.get(category_id, 0) + delta
+
 # ====== LIKES ======
 def add_like(db: Session, user_id: int, post_id: int):
     # Crear nuevo like
     like = models.Like(user_id=user_id, post_id=post_id)
     db.add(like)
+    # Actualizar el perfil de afinidad del usuario en la misma transacción
+    category_id = db.query(models.Post.category_id).filter(models.Post.id == post_id).scalar()
+    update_category_affinity(db, user_id, category_id, LIKE_AFFINITY_WEIGHT)
     db.commit()
     db.refresh(like)
+    seen_items.cache.add(user_id, post_id)
     
     # # Actualizar recomendaciones para este usuario
     # try:
@@ -128,6 +255,15 @@ def add_like(db: Session, user_id: int, post_id: int):
     
     return like
 
+def remove_like(db: Session, like: models.Like):
+    # Quitar el like y restar su peso (ya decaído) de la afinidad del usuario
+    category_id = db.query(models.Post.category_id).filter(models.Post.id == like.post_id).scalar()
+    weight = LIKE_AFFINITY_WEIGHT * affinity_decay(like.created_at, datetime.now())
+    update_category_affinity(db, like.user_id, category_id, -weight)
+    db.delete(like)
+    db.commit()
+    seen_items.cache.invalidate(like.user_id)
+
 # ====== VISITS ======
 def record_visit(db: Session, post_id: int, user_id: int = None, ip_address: str = None):
     # Verificar si el post existe
@@ -138,8 +274,12 @@ def record_visit(db: Session, post_id: int, user_id: int = None, ip_address: str
     # Crear una nueva visita
     visit = models.Visit(post_id=post_id, user_id=user_id, ip_address=ip_address)
     db.add(visit)
+    # Los visitantes anónimos no tienen perfil de afinidad
+    if user_id:
+        update_category_affinity(db, user_id, post.category_id, VISIT_AFFINITY_WEIGHT)
     db.commit()
     db.refresh(visit)
+    seen_items.cache.add(user_id, post_id)
     
     # # Actualizar recomendaciones para este usuario si está autenticado
     # if user_id:
@@ -173,22 +313,131 @@ def get_user_visits(db: Session, user_id: int):
     # Obtener todas las visitas de un usuario
     return db.query(models.Visit).filter(models.Visit.user_id == user_id).all()
 
-# crud.py (إضافة إلى الملف الحالي)
-from passlib.context import CryptContext
+# ====== AFINIDAD POR CATEGORÍA ======
+# Pesos de cada interacción en el perfil (los mismos que usaba el recomendador)
+LIKE_AFFINITY_WEIGHT = 3
+VISIT_AFFINITY_WEIGHT = 1
+# Vida media del decaimiento temporal en días (0 = sin decaimiento)
+AFFINITY_HALF_LIFE_DAYS = float(os.getenv("AFFINITY_HALF_LIFE_DAYS", "60"))
+
+def affinity_decay(since: datetime, now: datetime) -> float:
+    """Factor de decaimiento exponencial entre dos instantes"""
+    if AFFINITY_HALF_LIFE_DAYS <= 0 or since is None:
+        return 1.0
+    elapsed_days = max((now - since.replace(tzinfo=None)).total_seconds(), 0) / 86400
+    return 0.5 ** (elapsed_days / AFFINITY_HALF_LIFE_DAYS)
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+class days_between(FunctionElement):
+    """Días (fraccionarios) entre dos instantes, calculados en la BD"""
+    type = Float()
+    inherit_cache = True
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+@compiles(days_between)
+def _days_between_default(element, compiler, **kw):
+    since, until = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f"EXTRACT(EPOCH FROM ({until} - {since})) / 86400.0"
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+@compiles(days_between, "sqlite")
+def _days_between_sqlite(element, compiler, **kw):
+    since, until = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f"(julianday({until}) - julianday({since}))"
+
+@compiles(days_between, "mysql")
+def _days_between_mysql(element, compiler, **kw):
+    since, until = (compiler.process(arg, **kw) for arg in element.clauses)
+    return f"(TIMESTAMPDIFF(SECOND, {since}, {until}) / 86400.0)"
+
+def category_affinity_upsert(dialect: str, user_id: int, category_id: int, delta: float, now: datetime):
+    """INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE que suma delta a la afinidad en una sola sentencia.
+
+    El decaimiento del score acumulado se calcula en la BD sobre la fila bloqueada, así que dos
+    interacciones simultáneas no se pisan ni chocan al crear la fila.
+    """
+    table = models.UserCategoryAffinity.__table__
+    now_param = literal(now, DateTime(timezone=True))
+    decayed = table.c.score
+    if AFFINITY_HALF_LIFE_DAYS > 0:
+        elapsed = days_between(table.c.updated_at, now_param)
+        decayed = decayed * func.power(0.5, case((elapsed > 0, elapsed), else_=0) / AFFINITY_HALF_LIFE_DAYS)
+    score = case((decayed + delta > 0, decayed + delta), else_=0.0)
+    values = {"user_id": user_id, "category_id": category_id, "score": max(delta, 0.0), "updated_at": now}
+    if dialect == "mysql":
+        # MySQL asigna en orden: el score se calcula antes de mover updated_at
+        return mysql_insert(table).values(**values).on_duplicate_key_update([
+            ("score", score), ("updated_at", now_param)
+        ])
+    insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+    return insert(table).values(**values).on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.category_id],
+        set_={"score": score, "updated_at": now_param}
+    )
+
+def update_category_affinity(db: Session, user_id: int, category_id: int, delta: float, now: datetime = None):
+    """Suma delta a la afinidad (user_id, category_id) con un upsert atómico, sin hacer commit"""
+    if not user_id or not category_id:
+        return
+    statement = category_affinity_upsert(db.get_bind().dialect.name, user_id, category_id, delta, now or datetime.now())
+    db.execute(statement)
+
+def get_user_category_affinity(db: Session, user_id: int):
+    """Devuelve [(category_id, score)] del usuario ordenado de mayor a menor afinidad"""
+    now = datetime.now()
+    rows = db.query(models.UserCategoryAffinity).filter(
+        models.UserCategoryAffinity.user_id == user_id,
+        models.UserCategoryAffinity.score > 0
+    ).all()
+    weights = [(row.category_id, row.score * affinity_decay(row.updated_at, now)) for row in rows]
+    weights.sort(key=lambda x: x[1], reverse=True)
+    return weights
+
+def rebuild_category_affinity(db: Session, user_id: int = None):
+    """Reconstruye los perfiles desde el historial completo (backfill o reparación)"""
+    now = datetime.now()
+    likes = db.query(models.Like.user_id, models.Post.category_id, models.Like.created_at)\
+              .join(models.Post, models.Post.id == models.Like.post_id)\
+              .filter(models.Like.user_id != None, models.Post.category_id != None)
+    visits = db.query(models.Visit.user_id, models.Post.category_id, models.Visit.visit_date)\
+               .join(models.Post, models.Post.id == models.Visit.post_id)\
+               .filter(models.Visit.user_id != None, models.Post.category_id != None)
+    affinity_query = db.query(models.UserCategoryAffinity)
+    if user_id is not None:
+        likes = likes.filter(models.Like.user_id == user_id)
+        visits = visits.filter(models.Visit.user_id == user_id)
+        affinity_query = affinity_query.filter(models.UserCategoryAffinity.user_id == user_id)
+
+    # Pesos decaídos calculados en bloque y sumados por (usuario, categoría) con numpy
+    like_pairs, like_dates = recommender_model.interactions(likes)
+    visit_pairs, visit_dates = recommender_model.interactions(visits)
+    pairs = np.vstack([like_pairs, visit_pairs])
+    weights = np.concatenate([
+        LIKE_AFFINITY_WEIGHT * recommender_model.decay_factors(like_dates, now, AFFINITY_HALF_LIFE_DAYS),
+        VISIT_AFFINITY_WEIGHT * recommender_model.decay_factors(visit_dates, now, AFFINITY_HALF_LIFE_DAYS),
+    ])
+    keys, inverse = np.unique(pairs, axis=0, return_inverse=True)
+    scores = np.bincount(inverse.ravel(), weights=weights, minlength=len(keys))
+
+    affinity_query.delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.UserCategoryAffinity, [
+        {"user_id": int(uid), "category_id": int(category_id), "score": float(score), "updated_at": now}
+        for (uid, category_id), score in zip(keys, scores)
+    ])
+    db.commit()
+    return len(keys)
+
+# crud.py (إضافة إلى الملف الحالي)
+from starlette.concurrency import run_in_threadpool
+import security
+from security import pwd_context, verify_password, get_password_hash
+
+def normalize_login(value: str) -> str:
+    return value.strip().lower() if value else value
 
 def get_user_by_username(db: Session, username: str):
-    username = username.strip().lower()
+    # Columnas normalizadas e indexadas en lugar de lower(trim(...)), que obliga a recorrer la tabla
+    username = normalize_login(username)
     return db.query(models.User).filter(or_(
-        func.lower(func.trim(models.User.username)) == username,
-        func.lower(func.trim(models.User.email)) == username
+        models.User.username_lookup == username,
+        models.User.email_lookup == username
     )).first()
 
 def authenticate_user(db: Session, username: str, password: str):
@@ -210,4 +459,21 @@ def authenticate_admin(db: Session, username: str, password: str):
     # Comprobar si el usuario es administrador (is_admin=True)
     if not user.is_admin:
         return False
-    return user
\ No newline at end of file
+    return user
+
+async def authenticate_user_async(db: Session, username: str, password: str, require_admin: bool = False):
+    """Igual que authenticate_user/authenticate_admin pero sin bloquear el event loop"""
+    user = await run_in_threadpool(get_user_by_username, db, username)
+    if not user:
+        return False
+    # bcrypt se ejecuta en el executor acotado (puede lanzar security.PasswordHasherBusy)
+    valid, new_hash = await security.verify_and_upgrade_async(password, user.password)
+    if not valid:
+        return False
+    if require_admin and not user.is_admin:
+        return False
+    if new_hash:
+        # Actualizar el hash al coste de bcrypt configurado
+        user.password = new_hash
+        await run_in_threadpool(db.commit)
+    return user
@@ -0,0 +1,227 @@
+from sqlalchemy import select, func, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+import models
+import crud
+import seen_items
+import candidate_sources
+
+# Versiones asíncronas de las operaciones CRUD de los endpoints más solicitados
+
+# ====== USERS ======
+async def get_user(db: AsyncSession, user_id: int):
+    return await db.get(models.User, user_id)
+
+async def get_user_by_username(db: AsyncSession, username: str):
+    username = crud.normalize_login(username)
+    result = await db.execute(select(models.User).where(or_(
+        models.User.username_lookup == username,
+        models.User.email_lookup == username
+    )).limit(1))
+    return result.scalars().first()
+
+# ====== POSTS ======
+async def get_post_counts(db: AsyncSession, post_ids: List[int], user_id: int = None) -> Tuple[Dict[int, int], Dict[int, int], Set[int]]:
+    """Likes, visitas e isliked de varios posts con consultas agrupadas (no una por post)"""
+    if not post_ids:
+        return {}, {}, set()
+    likes_result = await db.execute(
+        select(models.Like.post_id, func.count(models.Like.id))
+        .where(models.Like.post_id.in_(post_ids))
+        .group_by(models.Like.post_id)
+    )
+    visits_result = await db.execute(
+        select(models.Visit.post_id, func.count(models.Visit.id))
+        .where(models.Visit.post_id.in_(post_ids))
+        .group_by(models.Visit.post_id)
+    )
+    liked = set()
+    if user_id:
+        liked_result = await db.execute(
+            select(models.Like.post_id)
+            .where(models.Like.post_id.in_(post_ids), models.Like.user_id == user_id)
+        )
+        liked = set(liked_result.scalars().all())
+    return dict(likes_result.all()), dict(visits_result.all()), liked
+
+def _post_to_dict(post: models.Post, likes: Dict[int, int], visits: Dict[int, int], liked: Set[int]) -> dict:
+    return {
+        "id": post.id,
+        "user_id": post.user_id,
+        "title": post.title,
+        "content": post.content,
+        "categorie": post.categorie,
+        "image": post.image,
+        "created_at": post.created_at,
+        "likes": likes.get(post.id, 0),
+        "visits": visits.get(post.id, 0),
+        "isliked": post.id in liked
+    }
+
+async def get_posts(db: AsyncSession, current_user_id: int = None, category_id: int = None) -> List[dict]:
+    query = select(models.Post)
+    if category_id:
+        # Usa el índice de posts.category_id: solo se leen las filas de esa categoría
+        query = query.where(models.Post.category_id == category_id)
+    result = await db.execute(query)
+    posts = result.scalars().all()
+    likes, visits, liked = await get_post_counts(db, [post.id for post in posts], current_user_id)
+    return [_post_to_dict(post, likes, visits, liked) for post in posts]
+
+async def get_posts_by_ids(db: AsyncSession, post_ids: List[int], current_user_id: int = None,
+                           excerpt: bool = False) -> List[dict]:
+    """Varios posts con una sola consulta IN, en el orden pedido (los inexistentes se omiten).
+
+    Con excerpt=True el contenido se recorta como en las recomendaciones.
+    """
+    if not post_ids:
+        return []
+    result = await db.execute(select(models.Post).where(models.Post.id.in_(post_ids)))
+    posts_by_id = {post.id: post for post in result.scalars().all()}
+    likes, visits, liked = await get_post_counts(db, list(posts_by_id), current_user_id)
+    posts = [_post_to_dict(posts_by_id[post_id], likes, visits, liked)
+             for post_id in post_ids if post_id in posts_by_id]
+    return _excerpts(posts) if excerpt else posts
+
+async def get_post(db: AsyncSession, post_id: int, current_user_id: int = None) -> Optional[dict]:
+    post = await db.get(models.Post, post_id)
+    if not post:
+        return None
+    likes, visits, liked = await get_post_counts(db, [post.id], current_user_id)
+    return _post_to_dict(post, likes, visits, liked)
+
+def _apply_counts(posts: List[dict], likes: Dict[int, int], visits: Dict[int, int], liked: Set[int]) -> List[dict]:
+    for post in posts:
+        post["likes"] = likes.get(post["id"], 0)
+        post["visits"] = visits.get(post["id"], 0)
+        post["isliked"] = post["id"] in liked
+    return posts
+
+async def enrich_posts(db: AsyncSession, posts: List[dict], user_id: int = None) -> List[dict]:
+    """Actualiza likes, visitas e isliked de una lista de posts (diccionarios) en bloque"""
+    likes, visits, liked = await get_post_counts(db, [post["id"] for post in posts], user_id)
+    return _apply_counts(posts, likes, visits, liked)
+
+async def get_post_page(db: AsyncSession, post_id: int, similar_posts: List[dict], user_id: int = None) -> Optional[dict]:
+    """Post + posts similares con una sola ronda de consultas agrupadas para los contadores"""
+    post = await db.get(models.Post, post_id)
+    if not post:
+        return None
+    likes, visits, liked = await get_post_counts(db, [post_id] + [p["id"] for p in similar_posts], user_id)
+    return {
+        "post": _post_to_dict(post, likes, visits, liked),
+        "similar": _apply_counts(similar_posts, likes, visits, liked),
+    }
+
+# ====== RECOMMENDATIONS ======
+async def get_precomputed_recommendations(db: AsyncSession, user_id: int, n: int) -> Optional[List[dict]]:
+    """Top-n precalculado por el batch (user_recommendations), sin los posts vistos desde entonces.
+
+    None si el usuario no tiene filas o no quedan n sin ver (el endpoint calcula en vivo).
+    """
+    result = await db.execute(
+        select(models.UserRecommendation.post_id)
+        .where(models.UserRecommendation.user_id == user_id)
+        .order_by(models.UserRecommendation.rank)
+    )
+    post_ids = np.array(result.scalars().all(), dtype=np.int64)
+    if not len(post_ids):
+        return None
+    seen = await seen_items.cache.get_async(db, user_id)
+    unseen = post_ids[~seen_items.contains(seen, post_ids)]
+    posts = await get_posts_by_ids(db, unseen[:n].tolist(), user_id, excerpt=True)
+    if len(posts) < n:
+        return None
+    return posts
+
+def _excerpts(posts: List[dict]) -> List[dict]:
+    """Mismo formato que las recomendaciones en vivo: extracto del contenido"""
+    for post in posts:
+        content = post["content"] or ""
+        if len(content) > 100:
+            post["content"] = content[:100] + "..."
+    return posts
+
+async def get_popular_posts(db: AsyncSession, n: int, user_id: int = None, exclude: Iterable[int] = ()) -> List[dict]:
+    """Respuesta de sobrecarga y relleno: la lista de populares ya cargada en memoria,
+    completada con los más recientes si no se ha cargado o no llega a n (aún sin interacciones)
+    """
+    exclude = set(exclude)
+    post_ids = [post_id for post_id in candidate_sources.popular.peek() or () if post_id not in exclude][:n]
+    if len(post_ids) < n:
+        exclude.update(post_ids)
+        result = await db.execute(select(models.Post.id).order_by(models.Post.id.desc()).limit(n + len(exclude)))
+        post_ids += [post_id for post_id in result.scalars().all() if post_id not in exclude][:n - len(post_ids)]
+    return await get_posts_by_ids(db, post_ids, user_id, excerpt=True)
+
+async def get_user_category_affinity(db: AsyncSession, user_id: int) -> List[Tuple[int, float]]:
+    """Equivalente asíncrono de crud.get_user_category_affinity"""
+    now = datetime.now()
+    result = await db.execute(
+        select(models.UserCategoryAffinity.category_id, models.UserCategoryAffinity.score,
+               models.UserCategoryAffinity.updated_at)
+        .where(models.UserCategoryAffinity.user_id == user_id, models.UserCategoryAffinity.score > 0)
+    )
+    weights = [(category_id, score * crud.affinity_decay(updated_at, now)) for category_id, score, updated_at in result.all()]
+    weights.sort(key=lambda x: x[1], reverse=True)
+    return weights
+
+async def get_heuristic_recommendations(db: AsyncSession, user_id: int, n: int) -> Optional[List[dict]]:
+    """Nivel rápido sin modelo (candidate_sources.heuristic); None si las listas en memoria están frías"""
+    sorted_categories = await get_user_category_affinity(db, user_id)
+    seen = await seen_items.cache.get_async(db, user_id)
+    post_ids = candidate_sources.heuristic(seen, [category_id for category_id, _ in sorted_categories], n)
+    if post_ids is None:
+        return None
+    return await get_posts_by_ids(db, post_ids, user_id, excerpt=True)
+
+# ====== CATEGORIES ======
+async def get_category(db: AsyncSession, name: str) -> Optional[crud.CategoryRef]:
+    """Categoría a partir de cualquier variante de su nombre (acentos, apóstrofos...)"""
+    category = crud.cached_category(name)
+    if category is None:
+        result = await db.execute(
+            select(models.Category.id, models.Category.name, models.Category.slug)
+            .where(models.Category.slug == crud.category_slug(name))
+        )
+        row = result.first()
+        if row is None:
+            return None
+        crud.remember_categories([row])
+        category = crud.CategoryRef(row.id, row.name)
+    return category
+
+async def get_category_counts(db: AsyncSession) -> List[dict]:
+    """Categorías con su número de posts (caché compartida con crud)"""
+    counts = crud.cached_category_counts()
+    if counts is None:
+        result = await db.execute(
+            select(models.Category.id, models.Category.name, models.Category.slug, func.count(models.Post.id))
+            .outerjoin(models.Post, models.Post.category_id == models.Category.id)
+            .group_by(models.Category.id, models.Category.name, models.Category.slug)
+        )
+        crud.set_category_counts(result.all())
+        counts = crud.cached_category_counts()
+    return counts
+
+# ====== VISITS ======
+async def update_category_affinity(db: AsyncSession, user_id: int, category_id: int, delta: float, now: datetime = None):
+    """Equivalente asíncrono de crud.update_category_affinity (mismo upsert, sin commit)"""
+    if not user_id or not category_id:
+        return
+    await db.execute(crud.category_affinity_upsert(db.bind.dialect.name, user_id, category_id, delta, now or datetime.now()))
+
+async def record_visit(db: AsyncSession, post_id: int, user_id: int = None, ip_address: str = None):
+    post = await db.get(models.Post, post_id)
+    if not post:
+        return None
+    visit = models.Visit(post_id=post_id, user_id=user_id, ip_address=ip_address)
+    db.add(visit)
+    if user_id:
+        await update_category_affinity(db, user_id, post.category_id, crud.VISIT_AFFINITY_WEIGHT)
+    await db.commit()
+    await db.refresh(visit)
+    seen_items.cache.add(user_id, post_id)
+    return visit
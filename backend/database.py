@@ -1,30 +1,166 @@
-import pymysql
-from sqlalchemy import create_engine
+import math
+import os
+import time
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
-DB_USER = "root"
-DB_PASSWORD = ""
-DB_HOST = "localhost"
-DB_PORT = "3306"
-DB_NAME = "pfe_database"
-
-# أولاً، الاتصال بدون تحديد قاعدة بيانات
-connection = pymysql.connect(
-    host=DB_HOST,
-    user=DB_USER,
-    password=DB_PASSWORD,
-    port=int(DB_PORT)
+import metrics
+
+# La URL se lee del entorno (docker-compose define DATABASE_URL); por defecto, MySQL local
+DATABASE_URL = os.getenv(
+    "DATABASE_URL",
+    "mysql+pymysql://root:@localhost:3306/pfe_database?charset=utf8mb4"
 )
 
-with connection.cursor() as cursor:
-    cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_NAME} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;")
-connection.close()
+# Ajustes del pool para MySQL/PostgreSQL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Antes del wait_timeout de MySQL
+
+# Motor de lectura/analítica: réplica opcional (por defecto la misma BD primaria, con su propio pool)
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL") or DATABASE_URL
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "5"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "5"))
+# Tiempo máximo por sentencia en el motor de analítica (0 = sin límite)
+ANALYTICS_STATEMENT_TIMEOUT_MS = int(os.getenv("ANALYTICS_STATEMENT_TIMEOUT_MS", "15000"))
+
+# Ajustes de SQLite
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# Drivers asíncronos equivalentes (aiomysql / aiosqlite)
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def to_async_url(url: str) -> str:
+    scheme, rest = url.split("://", 1)
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}://{rest}"
+
+def _instrumented_pool(pool_class, name: str):
+    """Pool que mide la espera al obtener una conexión"""
+    class InstrumentedPool(pool_class):
+        def _do_get(self):
+            start = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                metrics.observe(f"db.pool.{name}.checkout_wait_ms", (time.perf_counter() - start) * 1000)
+    return InstrumentedPool
+
+def _is_sqlite_memory(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def _engine_options(url, name: str, is_async: bool, pool_size: int = None, max_overflow: int = None) -> dict:
+    """Opciones de create_engine según el backend"""
+    backend = url.get_backend_name()
+    pool_class = AsyncAdaptedQueuePool if is_async else QueuePool
+    if backend == "sqlite":
+        options = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}}
+        if not _is_sqlite_memory(url):
+            options["poolclass"] = _instrumented_pool(pool_class, name)
+        return options
+    return {
+        "poolclass": _instrumented_pool(pool_class, name),
+        "pool_size": pool_size or DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW if max_overflow is None else max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+def _configure_engine(sync_engine, url, name: str):
+    """Pragmas de SQLite y métricas de conexiones en uso"""
+    if url.get_backend_name() == "sqlite":
+        @event.listens_for(sync_engine, "connect")
+        def _set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            if not _is_sqlite_memory(url):
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.close()
+            # power() solo existe si SQLite se compiló con las funciones matemáticas (afinidad decaída)
+            dbapi_connection.create_function("power", 2, math.pow, deterministic=True)
+
+    def _report_in_use(offset: int):
+        pool = sync_engine.pool
+        if hasattr(pool, "checkedout"):
+            metrics.set_gauge(f"db.pool.{name}.in_use", max(pool.checkedout() + offset, 0))
+
+    # Durante el evento checkin la conexión todavía cuenta como en uso
+    event.listen(sync_engine, "checkout", lambda *args: _report_in_use(0))
+    event.listen(sync_engine, "checkin", lambda *args: _report_in_use(-1))
+
+def _configure_statement_timeout(sync_engine, url, timeout_ms: int):
+    """Limita la duración de cada sentencia para que los escaneos largos no acaparen la BD"""
+    backend = url.get_backend_name()
+    if backend == "sqlite":
+        # SQLite no tiene timeout por sentencia: se interrumpe desde el progress handler
+        @event.listens_for(sync_engine, "connect")
+        def _set_progress_handler(dbapi_connection, connection_record):
+            info = connection_record.info
+            def _check_deadline():
+                deadline = info.get("statement_deadline")
+                return 1 if deadline and time.monotonic() > deadline else 0
+            dbapi_connection.set_progress_handler(_check_deadline, 10000)
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _set_deadline(conn, cursor, statement, parameters, context, executemany):
+            conn.info["statement_deadline"] = time.monotonic() + timeout_ms / 1000
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_session_timeout(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if backend == "mysql":
+            cursor.execute(f"SET SESSION MAX_EXECUTION_TIME={timeout_ms}")
+        elif backend == "postgresql":
+            cursor.execute(f"SET statement_timeout = {timeout_ms}")
+        cursor.close()
 
-# بعدها، الاتصال بـ SQLAlchemy باستخدام قاعدة البيانات
-DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?charset=utf8mb4"
+def make_engine(database_url: str, name: str = "primary", statement_timeout_ms: int = 0,
+                pool_size: int = None, max_overflow: int = None):
+    """Crea un motor síncrono ajustado al backend de database_url"""
+    url = make_url(database_url)
+    engine = create_engine(url, **_engine_options(url, name, False, pool_size, max_overflow))
+    _configure_engine(engine, url, name)
+    if statement_timeout_ms > 0:
+        _configure_statement_timeout(engine, url, statement_timeout_ms)
+    return engine
 
-engine = create_engine(DATABASE_URL)
+def make_async_engine(database_url: str, name: str = "primary_async"):
+    """Crea el motor asíncrono equivalente a database_url"""
+    url = make_url(to_async_url(database_url))
+    engine = create_async_engine(url, **_engine_options(url, name, is_async=True))
+    _configure_engine(engine.sync_engine, url, name)
+    return engine
+
+def ensure_database(database_url: str = DATABASE_URL):
+    """Crea la base de datos MySQL si no existe (bootstrap, no se ejecuta al importar)"""
+    url = make_url(database_url)
+    if url.get_backend_name() != "mysql" or not url.database:
+        return
+    server_engine = create_engine(url.set(database=""))
+    try:
+        with server_engine.connect() as conn:
+            conn.execute(text(
+                f"CREATE DATABASE IF NOT EXISTS {url.database} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"
+            ))
+    finally:
+        server_engine.dispose()
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
@@ -34,3 +170,28 @@ def get_db():
         yield db
     finally:
         db.close()
+
+# Motor de lectura para analítica y escaneos de entrenamiento del recomendador
+read_engine = make_engine(
+    READ_DATABASE_URL,
+    name="read",
+    statement_timeout_ms=ANALYTICS_STATEMENT_TIMEOUT_MS,
+    pool_size=DB_READ_POOL_SIZE,
+    max_overflow=DB_READ_MAX_OVERFLOW
+)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False)
+
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Motor asíncrono para los endpoints calientes
+async_engine = make_async_engine(DATABASE_URL)
+AsyncSessionLocal = sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from database import SessionLocal
 import models
+import crud
 from crud import get_users, get_user_by_username, get_user_by_email, create_user
 from schemas import UserCreate
 import time
@@ -181,6 +182,9 @@ def main():
         # Luego generar datos aleatorios con el rango de fechas especificado
         generate_random_visits(db, num_visits=1000, start_date=start_date, end_date=end_date)
         generate_random_likes(db, num_likes=500, start_date=start_date, end_date=end_date)
+        # Las interacciones se insertan directamente: reconstruir los perfiles de afinidad por categoría
+        affinity_rows = crud.rebuild_category_affinity(db)
+        print(f"✅ {affinity_rows} perfiles de afinidad reconstruidos")
         
         # Entrenar el sistema de recomendación
         print("\nDatos aleatorios generados con éxito.")
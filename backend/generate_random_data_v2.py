@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from database import SessionLocal
 import models
+import crud
 from crud import get_users, get_user_by_username, get_user_by_email, create_user
 from schemas import UserCreate
 import time
@@ -397,6 +398,9 @@ def main():
         print("🎯 ÉTAPE 4: GÉNÉRATION DES INTERACTIONS")
         print("=" * 50)
         generate_personalized_visits_and_likes(db, categories, start_date=start_date, end_date=end_date)
+        # Les likes/visites sont insérés directement: reconstruire les profils d'affinité par catégorie
+        affinity_rows = crud.rebuild_category_affinity(db)
+        print(f"✅ {affinity_rows} profils d'affinité reconstruits")
         
         # Résumé final
         print("\n" + "=" * 60)
@@ -0,0 +1,121 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+# GET condicional (ETag / Last-Modified) para los endpoints de posts
+# max-age para respuestas anónimas (0 = el cliente revalida siempre, con 304 si nada cambió)
+PUBLIC_MAX_AGE = int(os.getenv("POSTS_CACHE_MAX_AGE", "0"))
+
+@dataclass
+class CacheValidators:
+    etag: str
+    last_modified: Optional[datetime]
+    private: bool
+
+    @property
+    def cache_control(self) -> str:
+        # Las respuestas con isliked dependen del usuario: nunca en cachés compartidas
+        if self.private:
+            return "private, no-cache"
+        return f"public, max-age={PUBLIC_MAX_AGE}, must-revalidate"
+
+def _latest(*values) -> Optional[datetime]:
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    # La BD devuelve fechas sin zona: se interpretan como UTC
+    return max(v if v.tzinfo else v.replace(tzinfo=timezone.utc) for v in values)
+
+def _validators(tag: str, user_id: Optional[int], last_modified: Optional[datetime]) -> CacheValidators:
+    if user_id:
+        tag = f"{tag}-u{user_id}"
+    return CacheValidators(etag=f'W/"{tag}"', last_modified=last_modified, private=bool(user_id))
+
+async def posts_version(db: AsyncSession) -> tuple:
+    """Sello de versión barato de toda la colección: (max id, total, última fecha) de posts, likes y visitas"""
+    row = (await db.execute(select(
+        select(func.max(models.Post.id)).scalar_subquery(),
+        select(func.count(models.Post.id)).scalar_subquery(),
+        select(func.max(models.Post.created_at)).scalar_subquery(),
+        select(func.max(models.Like.id)).scalar_subquery(),
+        select(func.count(models.Like.id)).scalar_subquery(),
+        select(func.max(models.Like.created_at)).scalar_subquery(),
+        select(func.max(models.Visit.id)).scalar_subquery(),
+        select(func.count(models.Visit.id)).scalar_subquery(),
+        select(func.max(models.Visit.visit_date)).scalar_subquery(),
+    ))).one()
+    return tuple(row)
+
+async def posts_validators(db: AsyncSession, user_id: Optional[int] = None) -> CacheValidators:
+    (post_max, post_count, post_date,
+     like_max, like_count, like_date,
+     visit_max, visit_count, visit_date) = await posts_version(db)
+    tag = f"posts-{post_max or 0}.{post_count}-{like_max or 0}.{like_count}-{visit_max or 0}.{visit_count}"
+    return _validators(tag, user_id, _latest(post_date, like_date, visit_date))
+
+async def post_validators(db: AsyncSession, post_id: int, user_id: Optional[int] = None) -> Optional[CacheValidators]:
+    """Validadores de un post; None si el post no existe"""
+    row = (await db.execute(select(
+        select(models.Post.created_at).where(models.Post.id == post_id).scalar_subquery(),
+        select(func.max(models.Like.id)).where(models.Like.post_id == post_id).scalar_subquery(),
+        select(func.count(models.Like.id)).where(models.Like.post_id == post_id).scalar_subquery(),
+        select(func.max(models.Like.created_at)).where(models.Like.post_id == post_id).scalar_subquery(),
+        select(func.max(models.Visit.id)).where(models.Visit.post_id == post_id).scalar_subquery(),
+        select(func.count(models.Visit.id)).where(models.Visit.post_id == post_id).scalar_subquery(),
+        select(func.max(models.Visit.visit_date)).where(models.Visit.post_id == post_id).scalar_subquery(),
+    ))).one()
+    created_at, like_max, like_count, like_date, visit_max, visit_count, visit_date = row
+    if created_at is None:
+        return None
+    tag = f"post{post_id}-{like_max or 0}.{like_count}-{visit_max or 0}.{visit_count}"
+    return _validators(tag, user_id, _latest(created_at, like_date, visit_date))
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # Comparación débil (RFC 7232): se ignora el prefijo W/
+    if header.strip() == "*":
+        return True
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == wanted:
+            return True
+    return False
+
+def is_not_modified(request: Request, validators: CacheValidators) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match tiene prioridad sobre If-Modified-Since
+        return _etag_matches(if_none_match, validators.etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and validators.last_modified:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return validators.last_modified.replace(microsecond=0) <= since
+    return False
+
+def apply_headers(response: Response, validators: CacheValidators):
+    response.headers["ETag"] = validators.etag
+    response.headers["Cache-Control"] = validators.cache_control
+    if validators.last_modified:
+        response.headers["Last-Modified"] = format_datetime(validators.last_modified, usegmt=True)
+    # La misma URL devuelve contenido distinto con y sin usuario
+    response.headers["Vary"] = "Authorization"
+
+def not_modified_response(validators: CacheValidators) -> Response:
+    response = Response(status_code=304)
+    apply_headers(response, validators)
+    return response
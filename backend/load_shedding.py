@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+# Presupuesto de latencia y limitador de concurrencia de los endpoints de recomendación:
+# con la cola llena (shed) o el presupuesto agotado (degraded) se sirven los populares cacheados
+RECOMMENDATIONS_BUDGET_MS = int(os.getenv("RECOMMENDATIONS_BUDGET_MS", "1000"))
+RECOMMENDATIONS_MAX_CONCURRENCY = int(os.getenv("RECOMMENDATIONS_MAX_CONCURRENCY", "4"))
+RECOMMENDATIONS_MAX_QUEUE = int(os.getenv("RECOMMENDATIONS_MAX_QUEUE", "16"))
+SIMILAR_BUDGET_MS = int(os.getenv("SIMILAR_BUDGET_MS", "1000"))
+SIMILAR_MAX_CONCURRENCY = int(os.getenv("SIMILAR_MAX_CONCURRENCY", "4"))
+SIMILAR_MAX_QUEUE = int(os.getenv("SIMILAR_MAX_QUEUE", "16"))
+
+class Budget:
+    """Presupuesto de latencia de una petición, contado desde que se crea"""
+
+    def __init__(self, budget_ms: int):
+        self.deadline = time.perf_counter() + budget_ms / 1000
+
+    def remaining(self) -> float:
+        """Segundos que quedan (0 si ya se agotó)"""
+        return max(self.deadline - time.perf_counter(), 0.0)
+
+class ConcurrencyLimiter:
+    """Limita los cálculos de un endpoint en el threadpool y la cola de peticiones que los esperan.
+
+    Se usa desde el bucle de eventos (sin hilos): los contadores no necesitan lock.
+    """
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int):
+        self.name = name
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def _gauges(self):
+        metrics.set_gauge(f"{self.name}.in_flight", self.in_flight)
+        metrics.set_gauge(f"{self.name}.waiting", self.waiting)
+
+    def is_full(self) -> bool:
+        return self._semaphore.locked() and self.waiting >= self.max_queue
+
+    async def submit(self, budget: Budget, func, *args) -> Optional[asyncio.Future]:
+        """Lanza func(*args) en el threadpool cuando hay hueco.
+
+        None si la cola está llena (shed) o el hueco no llega dentro del presupuesto (degraded).
+        El hueco se libera cuando termina el cálculo, aunque la petición ya no lo espere.
+        """
+        if self.is_full():
+            metrics.increment(f"{self.name}.shed")
+            return None
+        if self._semaphore.locked():
+            self.waiting += 1
+            self._gauges()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), budget.remaining())
+            except asyncio.TimeoutError:
+                metrics.increment(f"{self.name}.degraded")
+                return None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self._gauges()
+        future = asyncio.ensure_future(run_in_threadpool(func, *args))
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: asyncio.Future):
+        self.in_flight -= 1
+        self._semaphore.release()
+        self._gauges()
+        # Marca la excepción como leída si nadie esperaba ya el resultado
+        if not future.cancelled():
+            future.exception()
+
+    def degraded(self):
+        """Para cuando el cálculo se lanzó pero no terminó dentro del presupuesto"""
+        metrics.increment(f"{self.name}.degraded")
+
+recommendations = ConcurrencyLimiter("recommendations", RECOMMENDATIONS_MAX_CONCURRENCY, RECOMMENDATIONS_MAX_QUEUE)
+similar = ConcurrencyLimiter("similar", SIMILAR_MAX_CONCURRENCY, SIMILAR_MAX_QUEUE)
@@ -1,12 +1,46 @@
 # main.py
-from fastapi import FastAPI, APIRouter
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, APIRouter, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
-from routers import users, posts, auth  # إضافة auth
+from starlette.concurrency import run_in_threadpool
+from database import engine, read_engine, async_engine, SessionLocal
+from routers import users, posts, auth, categories  # إضافة auth
+import create_db
+import metrics
+import search_index
+import training
+import warmup
+from responses import ORJSONResponse, add_compression
 
-Base.metadata.create_all(bind=engine)
+def load_search_index():
+    with SessionLocal() as db:
+        search_index.load_or_build(db)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Crear la base de datos y el esquema al arrancar, no al importar
+    await run_in_threadpool(create_db.init_db)
+    await run_in_threadpool(load_search_index)
+    # Entrenamiento periódico del recomendador en este proceso (desactivable si lo hace un worker aparte)
+    if training.TRAINING_SCHEDULER_ENABLED:
+        training.scheduler.start()
+    # Calentamiento en segundo plano: /api/ready responde 503 hasta que termina
+    if warmup.WARMUP_ENABLED:
+        warmup_task = asyncio.create_task(run_in_threadpool(warmup.run))
+    else:
+        warmup.ready.set()
+    yield
+    if warmup.WARMUP_ENABLED:
+        warmup.stop()
+        await warmup_task
+    await training.scheduler.stop()
+    await run_in_threadpool(search_index.index.save)
+    await async_engine.dispose()
+    read_engine.dispose()
+    engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # إعداد CORS
 origins = [
@@ -27,6 +61,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compresión de respuestas grandes (GET /api/posts, exportación Power BI)
+add_compression(app)
+
 # إنشاء Router رئيسي بالـ prefix "/api"
 api_router = APIRouter(prefix="/api")
 
@@ -34,6 +71,19 @@ api_router = APIRouter(prefix="/api")
 api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])  # إضافة router المصادقة
 api_router.include_router(users.router, prefix="/users", tags=["Users"])
 api_router.include_router(posts.router, prefix="/posts", tags=["Posts"])
+api_router.include_router(categories.router, prefix="/categories", tags=["Categories"])
 
 # إضافة api_router إلى التطبيق الرئيسي
-app.include_router(api_router)
\ No newline at end of file
+app.include_router(api_router)
+
+# Preparado para recibir tráfico (calentamiento terminado); para el readiness probe del balanceador
+@app.get("/api/ready")
+def read_ready():
+    if not warmup.ready.is_set():
+        return ORJSONResponse({"status": "warming_up"}, status_code=503)
+    return {"status": "ready"}
+
+# Métricas internas del proceso (hashing, pool, latencias...): solo administradores
+@app.get("/api/metrics")
+def read_metrics(admin = Depends(auth.get_current_admin)):
+    return metrics.snapshot()
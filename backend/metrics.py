@@ -0,0 +1,71 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict
+
+# Métricas en memoria del proceso (contadores, gauges y tiempos)
+# Número de muestras que se guardan por serie para calcular percentiles
+MAX_SAMPLES = 2048
+
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_gauges: Dict[str, float] = {}
+_timings: Dict[str, dict] = {}
+
+def increment(name: str, value: float = 1):
+    """Incrementa un contador"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+def set_gauge(name: str, value: float):
+    """Fija el valor actual de un gauge"""
+    with _lock:
+        _gauges[name] = value
+
+def observe(name: str, value: float):
+    """Registra una observación (normalmente una duración en ms)"""
+    with _lock:
+        series = _timings.get(name)
+        if series is None:
+            series = {"count": 0, "total": 0.0, "max": 0.0, "samples": deque(maxlen=MAX_SAMPLES)}
+            _timings[name] = series
+        series["count"] += 1
+        series["total"] += value
+        series["max"] = max(series["max"], value)
+        series["samples"].append(value)
+
+@contextmanager
+def timer(name: str):
+    """Mide la duración del bloque en milisegundos"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, (time.perf_counter() - start) * 1000)
+
+def _percentile(sorted_samples, q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(int(round(q * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+def snapshot() -> dict:
+    """Devuelve una copia de todas las métricas"""
+    with _lock:
+        timings = {}
+        for name, series in _timings.items():
+            samples = sorted(series["samples"])
+            timings[name] = {
+                "count": series["count"],
+                "avg": series["total"] / series["count"] if series["count"] else 0.0,
+                "max": series["max"],
+                "p50": _percentile(samples, 0.50),
+                "p95": _percentile(samples, 0.95),
+                "p99": _percentile(samples, 0.99),
+            }
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": timings,
+        }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, func, Boolean
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, func, Boolean, Float
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -8,6 +8,9 @@ class User(Base):
     username = Column(String(100), nullable=False)
     fullName = Column(String(100), nullable=False)
     email = Column(String(150), unique=True, nullable=False)
+    # Copias normalizadas (trim + minúsculas) e indexadas para el login
+    username_lookup = Column(String(100), index=True, nullable=True)
+    email_lookup = Column(String(150), index=True, nullable=True)
     password = Column(String(255), nullable=False)
     is_admin = Column(Boolean, default=False)  # False: usuario normal, True: administrador
     created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -15,6 +18,13 @@ class User(Base):
     posts = relationship("Post", back_populates="owner")
     likes = relationship("Like", back_populates="user")
 
+class Category(Base):
+    """Categorías normalizadas: posts y perfiles de afinidad referencian su id entero"""
+    __tablename__ = 'categories'
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)  # Nombre canónico que se muestra
+    slug = Column(String(100), unique=True, nullable=False)  # Clave de comparación (sin acentos ni mayúsculas)
+
 class Post(Base):
     __tablename__ = 'posts'
     id = Column(Integer, primary_key=True, index=True)
@@ -22,7 +32,8 @@ class Post(Base):
     title = Column(String(255))
     content = Column(Text)
     image = Column(String(255), nullable=True)  # URL o ruta de la imagen
-    categorie = Column(String(100), nullable=True)  # Categoría del post
+    categorie = Column(String(100), nullable=True)  # Nombre canónico de la categoría (copia de categories.name)
+    category_id = Column(Integer, ForeignKey("categories.id"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     owner = relationship("User", back_populates="posts")
@@ -32,8 +43,8 @@ class Post(Base):
 class Like(Base):
     __tablename__ = 'likes'
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
-    post_id = Column(Integer, ForeignKey("posts.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="likes")
@@ -42,10 +53,50 @@ class Like(Base):
 class Visit(Base):
     __tablename__ = 'visits'
     id = Column(Integer, primary_key=True, index=True)
-    post_id = Column(Integer, ForeignKey("posts.id"))
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Puede ser null para visitantes anónimos
+    post_id = Column(Integer, ForeignKey("posts.id"), index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # Puede ser null para visitantes anónimos
     ip_address = Column(String(50), nullable=True)  # Para identificar visitantes anónimos
     visit_date = Column(DateTime(timezone=True), server_default=func.now())
     
     post = relationship("Post", back_populates="visits")
     user = relationship("User", backref="visits")  # Relación opcional con el usuario
+
+class UserCategoryAffinity(Base):
+    """Perfil compacto de afinidad usuario-categoría, mantenido de forma incremental"""
+    __tablename__ = 'user_category_affinity'
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    category_id = Column(Integer, ForeignKey("categories.id"), primary_key=True)
+    score = Column(Float, nullable=False, default=0.0)  # Peso acumulado (like x3, visita x1), con decaimiento opcional
+    updated_at = Column(DateTime(timezone=True), nullable=False)  # Momento al que está referido el score
+
+class TrainingRun(Base):
+    """Historial de entrenamientos del recomendador"""
+    __tablename__ = 'training_runs'
+    id = Column(Integer, primary_key=True, index=True)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Float, nullable=True)
+    status = Column(String(20), nullable=False)  # ok, error
+    kind = Column(String(20), nullable=True)  # full (reajuste completo) o fold_in (proyección incremental)
+    engine = Column(String(20), nullable=True)
+    delta = Column(Integer, nullable=True)  # Interacciones y posts nuevos o borrados desde el entrenamiento anterior
+    n_users = Column(Integer, nullable=True)
+    n_posts = Column(Integer, nullable=True)
+    n_likes = Column(Integer, nullable=True)
+    n_visits = Column(Integer, nullable=True)
+    # Marca de agua de las interacciones con las que se entrenó
+    like_max_id = Column(Integer, nullable=True)
+    like_count = Column(Integer, nullable=True)
+    visit_max_id = Column(Integer, nullable=True)
+    visit_count = Column(Integer, nullable=True)
+    post_max_id = Column(Integer, nullable=True)
+    post_count = Column(Integer, nullable=True)
+    error = Column(Text, nullable=True)
+
+class UserRecommendation(Base):
+    """Top-N de recomendaciones precalculado por el batch (batch_recommendations.py)"""
+    __tablename__ = 'user_recommendations'
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    post_id = Column(Integer, ForeignKey("posts.id"), nullable=False)
+    score = Column(Float, nullable=False)
+    generated_at = Column(DateTime(timezone=True), nullable=False)
@@ -0,0 +1,57 @@
+from typing import List, Tuple
+
+import numpy as np
+
+# Puntuación vectorizada de recomendaciones (solo numpy: se usa también en los procesos del batch)
+# Bonus máximo de la categoría preferida número 1 (decrece linealmente con el puesto)
+CATEGORY_BONUS_SCALE = 5.0
+
+def category_bonus(sorted_categories: List[Tuple[int, float]], size: int) -> np.ndarray:
+    """Bonus por id de categoría a partir de [(category_id, score)] ordenado de mayor a menor afinidad"""
+    bonus = np.zeros(size, dtype=np.float32)
+    n_preferred = len(sorted_categories)
+    if n_preferred:
+        ids = np.array([category_id for category_id, _ in sorted_categories], dtype=np.int64)
+        keep = ids < size
+        bonus[ids[keep]] = ((n_preferred - np.arange(n_preferred)) / n_preferred * CATEGORY_BONUS_SCALE)[keep]
+    return bonus
+
+def category_bonus_matrix(user_rows: np.ndarray, category_ids: np.ndarray, scores: np.ndarray,
+                          n_users: int, n_categories: int) -> np.ndarray:
+    """Bonus de categoría de todos los usuarios a la vez: (n_users, n_categories).
+
+    Las filas de afinidad (fila de usuario, categoría, score) se ordenan por usuario y score
+    descendente; el puesto de cada categoría dentro de su usuario da el bonus.
+    """
+    bonus = np.zeros((n_users, n_categories), dtype=np.float32)
+    if len(user_rows) == 0:
+        return bonus
+    order = np.lexsort((-scores, user_rows))
+    user_rows, category_ids = user_rows[order], category_ids[order]
+    counts = np.bincount(user_rows, minlength=n_users)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ranks = np.arange(len(user_rows)) - starts[user_rows]
+    n_preferred = counts[user_rows]
+    bonus[user_rows, category_ids] = (n_preferred - ranks) / n_preferred * CATEGORY_BONUS_SCALE
+    return bonus
+
+def top_n(scores: np.ndarray, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Índices y scores de los n mayores de cada fila, ordenados (se ignoran los -inf)"""
+    n = min(n, scores.shape[1])
+    if n <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty
+    top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+def score_users(user_factors: np.ndarray, item_factors: np.ndarray, seen_indptr: np.ndarray,
+                seen_indices: np.ndarray, bonus: np.ndarray, post_categories: np.ndarray,
+                start: int, end: int, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Top-n de las filas de usuario [start, end): factores + bonus de categoría, sin los posts ya vistos"""
+    scores = user_factors[start:end] @ item_factors.T
+    scores += bonus[start:end][:, post_categories]
+    rows = np.repeat(np.arange(end - start), np.diff(seen_indptr[start:end + 1]))
+    scores[rows, seen_indices[seen_indptr[start]:seen_indptr[end]]] = -np.inf
+    return top_n(scores, n)
@@ -0,0 +1,359 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.decomposition import TruncatedSVD
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+import models
+
+# Modelo de factores latentes del recomendador: matriz usuario-post, entrenamiento y artefacto en disco
+RECOMMENDER_MODEL_PATH = os.getenv(
+    "RECOMMENDER_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "recommender_model.npz"),
+)
+RECOMMENDER_N_COMPONENTS = int(os.getenv("RECOMMENDER_N_COMPONENTS", "10"))
+# Motor de factorización: svd (TruncatedSVD) o als (ALS implícito ponderado por confianza)
+RECOMMENDER_ENGINE = os.getenv("RECOMMENDER_ENGINE", "svd")
+RECOMMENDER_ALS_ITERATIONS = int(os.getenv("RECOMMENDER_ALS_ITERATIONS", "15"))
+RECOMMENDER_ALS_REG = float(os.getenv("RECOMMENDER_ALS_REG", "0.1"))
+# Confianza c = 1 + alpha * peso (like 2, visita 1)
+RECOMMENDER_ALS_ALPHA = float(os.getenv("RECOMMENDER_ALS_ALPHA", "10"))
+RECOMMENDER_ALS_THREADS = int(os.getenv("RECOMMENDER_ALS_THREADS", str(min(os.cpu_count() or 1, 8))))
+# Regularización de las proyecciones por mínimos cuadrados del fold-in
+FOLD_IN_REGULARIZATION = float(os.getenv("RECOMMENDER_FOLD_IN_REG", "0.01"))
+
+# Pesos de cada interacción en la matriz (mayor peso para likes)
+LIKE_WEIGHT = 2.0
+VISIT_WEIGHT = 1.0
+# Vida media (días) del peso de una interacción; por defecto la misma que la afinidad. 0 = sin decaimiento
+INTERACTION_HALF_LIFE_DAYS = float(os.getenv("INTERACTION_HALF_LIFE_DAYS", os.getenv("AFFINITY_HALF_LIFE_DAYS", "60")))
+
+ARTIFACT_VERSION = 1
+
+@dataclass
+class InteractionMatrix:
+    """Matriz dispersa usuarios x posts; las filas/columnas siguen el orden de user_ids/post_ids"""
+    matrix: sparse.csr_matrix
+    user_ids: np.ndarray
+    post_ids: np.ndarray
+    n_likes: int
+    n_visits: int
+
+def interaction_high_water(db: Session) -> Dict[str, int]:
+    """Marca de agua de las interacciones: max id y total de likes, visitas y posts.
+
+    Si no cambia, el modelo entrenado con ella sigue al día (los totales detectan borrados).
+    """
+    row = db.execute(select(
+        select(func.max(models.Like.id)).scalar_subquery(),
+        select(func.count(models.Like.id)).scalar_subquery(),
+        select(func.max(models.Visit.id)).scalar_subquery(),
+        select(func.count(models.Visit.id)).scalar_subquery(),
+        select(func.max(models.Post.id)).scalar_subquery(),
+        select(func.count(models.Post.id)).scalar_subquery(),
+    )).one()
+    keys = ("like_max_id", "like_count", "visit_max_id", "visit_count", "post_max_id", "post_count")
+    return {key: int(value or 0) for key, value in zip(keys, row)}
+
+def lookup(sorted_ids: np.ndarray, ids: np.ndarray):
+    """Posiciones de ids en sorted_ids y máscara de los que existen"""
+    positions = np.searchsorted(sorted_ids, ids)
+    found = positions < len(sorted_ids)
+    found[found] &= sorted_ids[positions[found]] == ids[found]
+    return positions, found
+
+def to_datetime64(values) -> np.ndarray:
+    """Lista de datetimes (None -> NaT) a datetime64; las fechas con zona se toman como locales"""
+    return np.array([v.replace(tzinfo=None) if v is not None and v.tzinfo else v for v in values],
+                    dtype="datetime64[us]")
+
+def decay_factors(timestamps: np.ndarray, now: datetime, half_life_days: float = INTERACTION_HALF_LIFE_DAYS) -> np.ndarray:
+    """0.5 ** (edad en días / vida media) de cada fecha; 1 sin fecha o con la vida media a 0"""
+    if half_life_days <= 0:
+        return np.ones(len(timestamps))
+    age_days = (np.datetime64(now, "us") - timestamps) / np.timedelta64(1, "D")
+    factors = 0.5 ** (np.maximum(age_days, 0) / half_life_days)
+    return np.where(np.isnat(timestamps), 1.0, factors)
+
+def interactions(rows):
+    """Filas (user_id, post_id, fecha) -> array de pares y array datetime64"""
+    rows = list(rows)
+    pairs = np.array([(user_id, post_id) for user_id, post_id, _ in rows], dtype=np.int64).reshape(-1, 2)
+    return pairs, to_datetime64([date for _, _, date in rows])
+
+def build_interaction_matrix(db: Session, now: Optional[datetime] = None) -> InteractionMatrix:
+    """Construye la matriz con dos consultas y operaciones vectorizadas (sin bucles por usuario).
+
+    Cada interacción pesa LIKE_WEIGHT o VISIT_WEIGHT multiplicado por su decaimiento temporal.
+    """
+    now = now or datetime.now()
+    user_ids = np.array(db.execute(select(models.User.id).order_by(models.User.id)).scalars().all(), dtype=np.int64)
+    post_ids = np.array(db.execute(select(models.Post.id).order_by(models.Post.id)).scalars().all(), dtype=np.int64)
+    likes, like_dates = interactions(db.execute(
+        select(models.Like.user_id, models.Like.post_id, models.Like.created_at).where(models.Like.user_id != None)
+    ))
+    visits, visit_dates = interactions(db.execute(
+        select(models.Visit.user_id, models.Visit.post_id, models.Visit.visit_date).where(models.Visit.user_id != None)
+    ))
+
+    pairs = np.vstack([likes, visits])
+    weights = np.concatenate([
+        LIKE_WEIGHT * decay_factors(like_dates, now),
+        VISIT_WEIGHT * decay_factors(visit_dates, now),
+    ])
+    rows, known_users = lookup(user_ids, pairs[:, 0])
+    cols, known_posts = lookup(post_ids, pairs[:, 1])
+    # Descartar interacciones de usuarios o posts que ya no existen
+    valid = known_users & known_posts
+    # coo -> csr suma los duplicados (varias visitas al mismo post)
+    matrix = sparse.coo_matrix(
+        (weights[valid], (rows[valid], cols[valid])), shape=(len(user_ids), len(post_ids))
+    ).tocsr()
+    return InteractionMatrix(matrix, user_ids, post_ids, len(likes), len(visits))
+
+@dataclass
+class RecommenderModel:
+    """Factores latentes: score(usuario, post) = user_factors[u] · item_factors[p]"""
+    user_ids: np.ndarray
+    post_ids: np.ndarray
+    user_factors: np.ndarray
+    item_factors: np.ndarray
+    engine: str = "svd"
+    trained_at: datetime = field(default_factory=datetime.now)
+    high_water: Dict[str, int] = field(default_factory=dict)
+    # Último ajuste completo (los fold-in actualizan trained_at pero no fitted_at)
+    fitted_at: Optional[datetime] = None
+
+    def __post_init__(self):
+        if self.fitted_at is None:
+            self.fitted_at = self.trained_at
+        self._user_index = {int(uid): i for i, uid in enumerate(self.user_ids)}
+        self._post_index = {int(pid): i for i, pid in enumerate(self.post_ids)}
+
+    def user_index(self, user_id: int) -> Optional[int]:
+        return self._user_index.get(user_id)
+
+    def post_index(self, post_id: int) -> Optional[int]:
+        return self._post_index.get(post_id)
+
+    def user_scores(self, user_id: int) -> Optional[np.ndarray]:
+        """Scores del usuario para todos los posts (orden de post_ids); None si no está en el modelo"""
+        idx = self.user_index(user_id)
+        if idx is None:
+            return None
+        return self.item_factors @ self.user_factors[idx]
+
+    # ====== ARTEFACTO ======
+    def save(self, path: str = RECOMMENDER_MODEL_PATH):
+        """Guarda el modelo en un .npz (escritura atómica: los lectores nunca ven un fichero a medias)"""
+        meta = {
+            "version": ARTIFACT_VERSION,
+            "engine": self.engine,
+            "trained_at": self.trained_at.isoformat(),
+            "fitted_at": self.fitted_at.isoformat(),
+            "high_water": self.high_water,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                user_ids=self.user_ids,
+                post_ids=self.post_ids,
+                user_factors=self.user_factors.astype(np.float32),
+                item_factors=self.item_factors.astype(np.float32),
+                meta=np.array(json.dumps(meta)),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = RECOMMENDER_MODEL_PATH) -> Optional["RecommenderModel"]:
+        """Carga el artefacto; None si no existe o es de otra versión"""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta.get("version") != ARTIFACT_VERSION:
+                    return None
+                return cls(
+                    user_ids=data["user_ids"],
+                    post_ids=data["post_ids"],
+                    user_factors=data["user_factors"],
+                    item_factors=data["item_factors"],
+                    engine=meta["engine"],
+                    trained_at=datetime.fromisoformat(meta["trained_at"]),
+                    high_water=meta.get("high_water", {}),
+                    fitted_at=datetime.fromisoformat(meta["fitted_at"]) if meta.get("fitted_at") else None,
+                )
+        except (OSError, KeyError, ValueError):
+            return None
+
+def fit_svd(data: InteractionMatrix, n_components: int = RECOMMENDER_N_COMPONENTS) -> Optional[RecommenderModel]:
+    """TruncatedSVD sobre la matriz dispersa; None si la matriz es demasiado pequeña"""
+    n_users, n_posts = data.matrix.shape
+    if n_users < 2 or n_posts < 2 or data.matrix.nnz == 0:
+        return None
+    n_components = min(n_components, n_users - 1, n_posts - 1)
+    svd = TruncatedSVD(n_components=n_components, random_state=0)
+    user_factors = svd.fit_transform(data.matrix)
+    return RecommenderModel(
+        user_ids=data.user_ids,
+        post_ids=data.post_ids,
+        user_factors=user_factors,
+        item_factors=svd.components_.T,
+        engine="svd",
+    )
+
+def _project(interactions, factors: np.ndarray, reg: float) -> np.ndarray:
+    """Mínimos cuadrados regularizados: filas de interacciones -> factores (F^T F + reg I)^-1 F^T x"""
+    k = factors.shape[1]
+    gram = factors.T @ factors + reg * np.eye(k)
+    return np.linalg.solve(gram, np.asarray((interactions @ factors).T)).T
+
+def fold_in(model: RecommenderModel, data: InteractionMatrix,
+            reg: float = FOLD_IN_REGULARIZATION) -> RecommenderModel:
+    """Actualiza el modelo con la matriz actual sin reajustarlo.
+
+    Los posts ya conocidos conservan sus factores y los nuevos se proyectan sobre los factores
+    de usuario existentes; después todos los usuarios (nuevos o con actividad nueva) se
+    proyectan sobre los factores de post. Coste: un par de productos dispersos y un solve k x k.
+    """
+    k = model.item_factors.shape[1]
+    post_positions, known_posts = lookup(model.post_ids, data.post_ids)
+    item_factors = np.zeros((len(data.post_ids), k))
+    item_factors[known_posts] = model.item_factors[post_positions[known_posts]]
+
+    # Con ALS las proyecciones son el mismo paso ponderado por confianza del entrenamiento
+    if model.engine == "als":
+        project = lambda interactions, factors: als_half_step(interactions.tocsr(), factors)
+    else:
+        project = lambda interactions, factors: _project(interactions, factors, reg)
+
+    new_posts = ~known_posts
+    if new_posts.any():
+        user_positions, known_users = lookup(model.user_ids, data.user_ids)
+        if known_users.any():
+            columns = data.matrix[known_users][:, new_posts].T
+            item_factors[new_posts] = project(columns, model.user_factors[user_positions[known_users]])
+
+    user_factors = project(data.matrix, item_factors)
+    return RecommenderModel(
+        user_ids=data.user_ids,
+        post_ids=data.post_ids,
+        user_factors=user_factors,
+        item_factors=item_factors,
+        engine=model.engine,
+        fitted_at=model.fitted_at,
+    )
+
+# ====== ALS IMPLÍCITO ======
+def _als_solve_rows(matrix: sparse.csr_matrix, fixed: np.ndarray, outer: np.ndarray, gram: np.ndarray,
+                    reg: float, alpha: float, out: np.ndarray, start: int, end: int):
+    """Resuelve las filas [start, end): x = (F^T F + F^T (C-I) F + reg I)^-1 F^T C p
+
+    Las ecuaciones normales del bloque salen de dos productos dispersa x densa (F^T (C-I) F como
+    suma de los productos exteriores de `outer` ponderados por la confianza) y se resuelven con un
+    único np.linalg.solve apilado: todo es código compilado que libera el GIL, así que los
+    bloques avanzan en paralelo en el threadpool.
+    """
+    k = fixed.shape[1]
+    block = matrix[start:end]
+    confidence = block.copy()
+    confidence.data = alpha * block.data  # c - 1
+    preference = block.copy()
+    preference.data = 1.0 + confidence.data  # C p, con p = 1 en las interacciones observadas
+    a = (confidence @ outer).reshape(-1, k, k) + (gram + reg * np.eye(k))
+    b = preference @ fixed
+    # Las filas sin interacciones quedan con b = 0 y por tanto x = 0
+    out[start:end] = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+
+def als_half_step(matrix: sparse.csr_matrix, fixed: np.ndarray, reg: float = RECOMMENDER_ALS_REG,
+                  alpha: float = RECOMMENDER_ALS_ALPHA, pool: Optional[ThreadPoolExecutor] = None,
+                  n_blocks: int = 1) -> np.ndarray:
+    """Factores de todas las filas de matrix con los de las columnas fijos, por bloques en paralelo"""
+    n_rows = matrix.shape[0]
+    out = np.zeros((n_rows, fixed.shape[1]))
+    gram = fixed.T @ fixed
+    # Producto exterior f f^T de cada fila fija, aplanado: (n_fijas, k*k)
+    outer = (fixed[:, :, None] * fixed[:, None, :]).reshape(fixed.shape[0], -1)
+    block = max((n_rows + n_blocks - 1) // n_blocks, 1)
+    bounds = [(start, min(start + block, n_rows)) for start in range(0, n_rows, block)]
+    if pool is None or len(bounds) == 1:
+        for start, end in bounds:
+            _als_solve_rows(matrix, fixed, outer, gram, reg, alpha, out, start, end)
+    else:
+        futures = [pool.submit(_als_solve_rows, matrix, fixed, outer, gram, reg, alpha, out, start, end)
+                   for start, end in bounds]
+        for future in futures:
+            future.result()
+    return out
+
+def fit_als(data: InteractionMatrix, n_components: int = RECOMMENDER_N_COMPONENTS,
+            iterations: int = RECOMMENDER_ALS_ITERATIONS, reg: float = RECOMMENDER_ALS_REG,
+            alpha: float = RECOMMENDER_ALS_ALPHA, threads: int = RECOMMENDER_ALS_THREADS) -> Optional[RecommenderModel]:
+    """ALS para feedback implícito (Hu, Koren y Volinsky 2008) sobre la matriz CSR"""
+    n_users, n_posts = data.matrix.shape
+    if n_users < 2 or n_posts < 2 or data.matrix.nnz == 0:
+        return None
+    user_items = data.matrix.tocsr()
+    item_users = data.matrix.T.tocsr()
+    rng = np.random.default_rng(0)
+    user_factors = rng.normal(scale=0.01, size=(n_users, n_components))
+    item_factors = rng.normal(scale=0.01, size=(n_posts, n_components))
+    threads = max(threads, 1)
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for _ in range(iterations):
+            user_factors = als_half_step(user_items, item_factors, reg, alpha, pool, threads)
+            item_factors = als_half_step(item_users, user_factors, reg, alpha, pool, threads)
+    return RecommenderModel(
+        user_ids=data.user_ids,
+        post_ids=data.post_ids,
+        user_factors=user_factors,
+        item_factors=item_factors,
+        engine="als",
+    )
+
+ENGINES = {
+    "svd": fit_svd,
+    "als": fit_als,
+}
+
+def fit_model(data: InteractionMatrix, engine: str = RECOMMENDER_ENGINE) -> Optional[RecommenderModel]:
+    """Ajuste completo con el motor configurado"""
+    if engine not in ENGINES:
+        raise ValueError(f"Motor de recomendación desconocido: {engine}")
+    return ENGINES[engine](data)
+
+# Modelo publicado en este proceso; se recarga si otro proceso guarda un artefacto nuevo
+_model: Optional[RecommenderModel] = None
+_model_mtime: Optional[int] = None
+_model_lock = threading.Lock()
+
+def get_model() -> Optional[RecommenderModel]:
+    global _model, _model_mtime
+    try:
+        mtime = os.stat(RECOMMENDER_MODEL_PATH).st_mtime_ns
+    except OSError:
+        return _model
+    if mtime != _model_mtime:
+        with _model_lock:
+            if mtime != _model_mtime:
+                model = RecommenderModel.load()
+                if model is not None:
+                    _model = model
+                _model_mtime = mtime
+    return _model
+
+def publish_model(model: RecommenderModel, path: str = RECOMMENDER_MODEL_PATH):
+    """Guarda el artefacto y lo deja como modelo actual de este proceso"""
+    global _model, _model_mtime
+    model.save(path)
+    with _model_lock:
+        _model = model
+        _model_mtime = os.stat(path).st_mtime_ns
@@ -0,0 +1,69 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+
+import metrics
+import responses
+
+# Caché de respuestas ya serializadas (bytes) para los endpoints anónimos más solicitados
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+class ResponseCache:
+    """LRU limitada por tamaño total en bytes.
+
+    La clave empieza por su ámbito ("posts", "post", ...) y termina con la versión de los datos
+    (etag o posts_version): no hace falta invalidar al cambiar los datos, y al guardar una versión
+    nueva se descarta en O(1) la anterior del mismo hueco (la clave sin la versión).
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._slots: Dict[tuple, tuple] = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                metrics.increment(f"response_cache.{key[0]}.miss")
+                return None
+            self._entries.move_to_end(key)
+        metrics.increment(f"response_cache.{key[0]}.hit")
+        return body
+
+    def _remove(self, key: tuple):
+        self._size -= len(self._entries.pop(key))
+        if self._slots.get(key[:-1]) == key:
+            del self._slots[key[:-1]]
+
+    def put(self, key: tuple, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            superseded = self._slots.get(key[:-1])
+            if superseded is not None and superseded in self._entries:
+                self._remove(superseded)
+                if superseded != key:
+                    metrics.increment("response_cache.superseded")
+            self._entries[key] = body
+            self._slots[key[:-1]] = key
+            self._size += len(body)
+            # Expulsar las entradas menos usadas hasta volver al límite
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                metrics.increment("response_cache.evicted")
+            metrics.set_gauge("response_cache.bytes", self._size)
+
+def encode(payload: Any) -> bytes:
+    """Serializa igual que la respuesta por defecto de la API (orjson)"""
+    return responses.dumps(payload)
+
+def json_response(body: bytes) -> Response:
+    return Response(content=body, media_type="application/json")
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
@@ -0,0 +1,51 @@
+import os
+from typing import Any
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.middleware.gzip import GZipMiddleware
+
+# Serialización JSON rápida (orjson) y compresión de respuestas grandes
+# Tamaño mínimo (bytes) a partir del cual se comprime la respuesta
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
+GZIP_COMPRESS_LEVEL = int(os.getenv("GZIP_COMPRESS_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+try:
+    from brotli_asgi import BrotliMiddleware  # Opcional: pip install brotli-asgi
+except ImportError:
+    BrotliMiddleware = None
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def dumps(content: Any) -> bytes:
+    """Serializa a JSON con orjson.
+
+    Las fechas sin zona horaria salen en ISO 8601 sin offset, igual que con
+    jsonable_encoder; los tipos que orjson no conoce pasan por jsonable_encoder.
+    """
+    return orjson.dumps(content, default=jsonable_encoder, option=ORJSON_OPTIONS)
+
+class ORJSONResponse(JSONResponse):
+    """Respuesta por defecto de la API"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+def add_compression(app):
+    """Brotli (con gzip de respaldo) si brotli-asgi está instalado; si no, gzip"""
+    if BrotliMiddleware is not None:
+        app.add_middleware(
+            BrotliMiddleware,
+            quality=BROTLI_QUALITY,
+            minimum_size=COMPRESSION_MINIMUM_SIZE,
+            gzip_fallback=True,
+        )
+    else:
+        app.add_middleware(
+            GZipMiddleware,
+            minimum_size=COMPRESSION_MINIMUM_SIZE,
+            compresslevel=GZIP_COMPRESS_LEVEL,
+        )
@@ -5,25 +5,36 @@ from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from typing import Optional
+from dataclasses import dataclass
+from starlette.concurrency import run_in_threadpool
+from cachetools import TTLCache
+import os
+import threading
 
-import schemas, crud, models
-from database import SessionLocal
+import schemas, crud, crud_async, models, security
+from database import get_db, get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # إعدادات JWT
 SECRET_KEY = "YOUR_SECRET_KEY"  # يجب تغييرها في الإنتاج واستخدام متغيرات بيئية
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Caché en memoria de usuarios autenticados (por user_id) para no consultar la BD en cada petición
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
 router = APIRouter()
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def hasher_busy_exception():
+    # Demasiados logins/registros en cola: rechazar en lugar de congelar el servidor
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="الخدمة مشغولة مؤقتًا، أعد المحاولة بعد لحظات",
+        headers={"Retry-After": "1"},
+    )
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -35,28 +46,90 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+@dataclass(frozen=True)
+class Principal:
+    """Datos del usuario autenticado, desacoplados de la sesión de SQLAlchemy"""
+    id: int
+    username: str
+    fullName: str
+    email: str
+    is_admin: bool
+    created_at: datetime
+
+_principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+_principal_cache_lock = threading.Lock()  # TTLCache no es thread-safe
+
+def access_token_claims(user) -> dict:
+    return {"sub": user.username, "user_id": user.id, "is_admin": bool(user.is_admin)}
+
+def _decode_token(token: str) -> Optional[schemas.TokenData]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+    return schemas.TokenData(
+        username=username,
+        user_id=payload.get("user_id"),
+        is_admin=bool(payload.get("is_admin", False))
+    )
+
+async def resolve_principal(token: str, db: AsyncSession) -> Optional[Principal]:
+    """Resuelve el usuario del token: caché por user_id y, si falla, búsqueda por clave primaria"""
+    token_data = _decode_token(token)
+    if token_data is None:
+        return None
+    if token_data.user_id is not None:
+        with _principal_cache_lock:
+            principal = _principal_cache.get(token_data.user_id)
+        if principal is not None:
+            return principal
+        user = await crud_async.get_user(db, token_data.user_id)
+    else:
+        # Tokens emitidos antes de incluir user_id
+        user = await crud_async.get_user_by_username(db, username=token_data.username)
+    if user is None:
+        return None
+    principal = Principal(
+        id=user.id,
+        username=user.username,
+        fullName=user.fullName,
+        email=user.email,
+        is_admin=bool(user.is_admin),
+        created_at=user.created_at
+    )
+    with _principal_cache_lock:
+        _principal_cache[principal.id] = principal
+    return principal
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="بيانات الاعتماد غير صالحة",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
-    user = crud.get_user_by_username(db, username=token_data.username)
+    user = await resolve_principal(token, db)
     if user is None:
         raise credentials_exception
     return user
 
+async def get_current_admin(current_user: Principal = Depends(get_current_user)):
+    # Superficies de administración (métricas internas...): solo usuarios con is_admin
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="ليس لديك صلاحيات المسؤول",
+        )
+    return current_user
+
 @router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.authenticate_user(db, form_data.username, form_data.password)
+    try:
+        user = await crud.authenticate_user_async(db, form_data.username, form_data.password)
+    except security.PasswordHasherBusy:
+        raise hasher_busy_exception()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -65,7 +138,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=access_token_claims(user), expires_delta=access_token_expires
     )
     return {
         "access_token": access_token, 
@@ -76,7 +149,10 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     }
 @router.post("/token_admin", response_model=schemas.Token)
 async def login_for_access_token_admin(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = crud.authenticate_admin(db, form_data.username, form_data.password)
+    try:
+        user = await crud.authenticate_user_async(db, form_data.username, form_data.password, require_admin=True)
+    except security.PasswordHasherBusy:
+        raise hasher_busy_exception()
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -85,7 +161,7 @@ async def login_for_access_token_admin(form_data: OAuth2PasswordRequestForm = De
         )
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=access_token_claims(user), expires_delta=access_token_expires
     )
     return {
         "access_token": access_token, 
@@ -97,13 +173,17 @@ async def login_for_access_token_admin(form_data: OAuth2PasswordRequestForm = De
 
 @router.post("/register", response_model=schemas.UserOut)
 async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_username(db, username=user.username)
+    db_user = await run_in_threadpool(crud.get_user_by_username, db, user.username)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="اسم المستخدم مسجل بالفعل"
         )
-    return crud.create_user(db, user)
+    try:
+        hashed_password = await security.hash_password_async(user.password)
+    except security.PasswordHasherBusy:
+        raise hasher_busy_exception()
+    return await run_in_threadpool(crud.create_user, db, user, hashed_password)
 
 @router.get("/me", response_model=schemas.UserOut)
 async def read_users_me(current_user = Depends(get_current_user)):
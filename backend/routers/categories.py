@@ -0,0 +1,13 @@
+# routers/categories.py
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+import schemas, crud_async
+from database import get_async_db
+
+router = APIRouter()
+
+@router.get("/", response_model=List[schemas.CategoryCount])
+async def read_categories(db: AsyncSession = Depends(get_async_db)):
+    """Categorías con su número de posts, sin cargar los posts"""
+    return await crud_async.get_category_counts(db)
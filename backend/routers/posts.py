@@ -1,11 +1,17 @@
 # routers/posts.py (تحديث)
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, BackgroundTasks, Query
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from typing import List, Optional, Dict
-import schemas, crud, models  # Importar models
-from database import SessionLocal, get_db
-from routers.auth import get_current_user, SECRET_KEY, ALGORITHM  # استيراد دالة التحقق من المستخدم والمتغيرات اللازمة
+import schemas, crud, crud_async, models, http_cache, metrics, search_index, load_shedding, session_recommender  # Importar models
+from response_cache import response_cache, encode as encode_response, json_response
+from datetime import date
+import asyncio
+import os
+from database import SessionLocal, ReadSessionLocal, AsyncSessionLocal, get_db, get_read_db, get_async_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from routers.auth import get_current_user, resolve_principal, SECRET_KEY, ALGORITHM  # استيراد دالة التحقق من المستخدم والمتغيرات اللازمة
 
 router = APIRouter()
 
@@ -23,27 +29,45 @@ from jose import JWTError, jwt
 from typing import Optional
 
 # Definir una versión opcional del get_current_user
-async def get_optional_user(token: str = Depends(OAuth2PasswordBearer(tokenUrl="api/auth/token", auto_error=False)), db: Session = Depends(get_db)):
+async def get_optional_user(token: str = Depends(OAuth2PasswordBearer(tokenUrl="api/auth/token", auto_error=False)), db: AsyncSession = Depends(get_async_db)):
     if not token:
         return None
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            return None
-        token_data = schemas.TokenData(username=username)
-    except JWTError:
-        return None
-    user = crud.get_user_by_username(db, username=token_data.username)
-    if user is None:
-        return None
-    return user
+    return await resolve_principal(token, db)
 
 @router.get("/", response_model=list[schemas.PostOut])
-def read_posts(db: Session = Depends(get_db), current_user = Depends(get_optional_user)):
+async def read_posts(
+    request: Request,
+    response: Response,
+    categorie: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_optional_user)
+):
     # Si el usuario está autenticado, pasar su ID para verificar sus likes
     current_user_id = current_user.id if current_user else None
-    return crud.get_posts(db, current_user_id)
+    
+    # GET condicional: 304 sin construir la lista si nada ha cambiado
+    validators = await http_cache.posts_validators(db, current_user_id)
+    if http_cache.is_not_modified(request, validators):
+        return http_cache.not_modified_response(validators)
+    http_cache.apply_headers(response, validators)
+    category_id = None
+    if categorie:
+        category = await crud_async.get_category(db, categorie)
+        if category is None:
+            return []
+        category_id = category.id
+    if current_user_id:
+        return await crud_async.get_posts(db, current_user_id, category_id)
+    
+    # Anónimo: servir los bytes ya serializados para esta versión de los datos
+    cache_key = ("posts", category_id, validators.etag)
+    body = response_cache.get(cache_key)
+    if body is None:
+        body = encode_response(await crud_async.get_posts(db, category_id=category_id))
+        response_cache.put(cache_key, body)
+    cached_response = json_response(body)
+    http_cache.apply_headers(cached_response, validators)
+    return cached_response
 
 @router.get("/my-posts", response_model=list[schemas.PostOut])
 def read_my_posts(
@@ -54,8 +78,22 @@ def read_my_posts(
 
 # Endpoint para obtener estadísticas generales de publicaciones
 @router.get("/stats", response_model=Dict)
-def get_post_stats(db: Session = Depends(get_db), current_user = Depends(get_optional_user)):
+async def get_post_stats(
+    db: Session = Depends(get_read_db),
+    async_db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_optional_user)
+):
     """Obtiene estadísticas generales de todas las publicaciones"""
+    # Las estadísticas no dependen del usuario: una entrada por versión de los datos y día
+    cache_key = ("stats", (await http_cache.posts_version(async_db), date.today()))
+    body = response_cache.get(cache_key)
+    if body is None:
+        body = encode_response(await run_in_threadpool(compute_post_stats, db))
+        response_cache.put(cache_key, body)
+    return json_response(body)
+
+def compute_post_stats(db: Session) -> Dict:
+    """Calcula las estadísticas generales de todas las publicaciones"""
     
     # Total de posts
     total_posts = db.query(models.Post).count()
@@ -67,13 +105,14 @@ def get_post_stats(db: Session = Depends(get_db), current_user = Depends(get_opt
     total_visits = db.query(models.Visit).count()
     
     # Categorías populares
-    categories = db.query(models.Post.categorie, func.count(models.Post.id).label('count'))\
-                .filter(models.Post.categorie != None)\
-                .group_by(models.Post.categorie)\
+    categories = db.query(models.Post.category_id, func.count(models.Post.id).label('count'))\
+                .filter(models.Post.category_id != None)\
+                .group_by(models.Post.category_id)\
                 .order_by(func.count(models.Post.id).desc())\
                 .all()
     
-    popular_categories = [{'category': cat, 'count': count} for cat, count in categories]
+    category_names = crud.get_category_names(db, [category_id for category_id, _ in categories])
+    popular_categories = [{'category': category_names.get(category_id), 'count': count} for category_id, count in categories]
     
     # Posts más populares por likes
     most_liked_posts_query = db.query(models.Post, func.count(models.Like.id).label('like_count'))\
@@ -158,42 +197,83 @@ def get_post_stats(db: Session = Depends(get_db), current_user = Depends(get_opt
         "visits_by_time": visits_by_time
     }
 
+# Tamaño máximo de página de GET /search
+MAX_SEARCH_PAGE_SIZE = 50
+
+@router.get("/search", response_model=schemas.SearchResults)
+async def search_posts(
+    q: str,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(10, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_optional_user)
+):
+    """Búsqueda por título y contenido (sin distinguir acentos), ordenada por BM25"""
+    with metrics.timer("search.request_ms"):
+        with metrics.timer("search.query_ms"):
+            total, hits = search_index.index.search(q, (page - 1) * page_size, page_size)
+        scores = dict(hits)
+        results = await crud_async.get_posts_by_ids(db, list(scores), current_user.id if current_user else None)
+        for post in results:
+            post["score"] = round(scores[post["id"]], 4)
+    return {"query": q, "total": total, "page": page, "page_size": page_size, "results": results}
+
+# Máximo de ids aceptados por GET /batch
+MAX_BATCH_IDS = 100
+
+@router.get("/batch", response_model=list[schemas.PostOut])
+async def read_posts_batch(
+    ids: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_optional_user)
+):
+    """Obtiene varios posts por id (ids=1,2,3) en una sola petición, conservando el orden"""
+    try:
+        post_ids = [int(value) for value in ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids debe ser una lista de enteros separados por comas")
+    # Quitar duplicados manteniendo el orden pedido
+    post_ids = list(dict.fromkeys(post_ids))
+    if len(post_ids) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"Se admiten como máximo {MAX_BATCH_IDS} ids")
+    return await crud_async.get_posts_by_ids(db, post_ids, current_user.id if current_user else None)
+
 @router.get("/{post_id}", response_model=schemas.PostOut)
-def read_post(
+async def read_post(
     post_id: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_optional_user)
 ):
-    # Verificar si el post existe
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
-    if not post:
+    current_user_id = current_user.id if current_user else None
+    validators = await http_cache.post_validators(db, post_id, current_user_id)
+    if not validators:
         raise HTTPException(status_code=404, detail="Post not found")
+    if http_cache.is_not_modified(request, validators):
+        return http_cache.not_modified_response(validators)
     
-    # Crear un diccionario con los datos del post
-    post_dict = {
-        "id": post.id,
-        "user_id": post.user_id,
-        "title": post.title,
-        "content": post.content,
-        "image": post.image,
-        "categorie": post.categorie,
-        "created_at": post.created_at,
-        # Contar el número total de likes
-        "likes": db.query(models.Like).filter(models.Like.post_id == post.id).count(),
-        # Contar el número total de visitas
-        "visits": db.query(models.Visit).filter(models.Visit.post_id == post.id).count()
-    }
+    cache_key = ("post", post_id, validators.etag)
+    if not current_user_id:
+        body = response_cache.get(cache_key)
+        if body is not None:
+            cached_response = json_response(body)
+            http_cache.apply_headers(cached_response, validators)
+            return cached_response
     
-    # Verificar si el usuario actual ha dado like (si está autenticado)
-    if current_user:
-        post_dict["isliked"] = db.query(models.Like).filter(
-            models.Like.post_id == post.id,
-            models.Like.user_id == current_user.id
-        ).first() is not None
-    else:
-        post_dict["isliked"] = False
+    # Post con sus contadores y, si está autenticado, si el usuario le ha dado like
+    post = await crud_async.get_post(db, post_id, current_user_id)
+    if not post:
+        raise HTTPException(status_code=404, detail="Post not found")
+    if current_user_id:
+        http_cache.apply_headers(response, validators)
+        return post
     
-    return post_dict
+    body = encode_response(post)
+    response_cache.put(cache_key, body)
+    cached_response = json_response(body)
+    http_cache.apply_headers(cached_response, validators)
+    return cached_response
 
 @router.post("/{post_id}/like", response_model=schemas.LikeOut)
 def like_post(
@@ -214,8 +294,7 @@ def like_post(
     
     if existing_like:
         # Si ya existe un like, lo eliminamos (toggle)
-        db.delete(existing_like)
-        db.commit()
+        crud.remove_like(db, existing_like)
         
         # Crear un objeto que cumpla con el esquema LikeOut
         from datetime import datetime
@@ -229,22 +308,40 @@ def like_post(
         # Si no existe, creamos un nuevo like
         return crud.add_like(db, current_user.id, post_id)
 
+def get_session_token(request: Request) -> Optional[str]:
+    """Token de sesión del visitante: cabecera X-Session-Id o cookie session_id (se ignoran los anómalos)"""
+    token = request.headers.get(session_recommender.SESSION_HEADER) or request.cookies.get(session_recommender.SESSION_COOKIE)
+    if token and len(token) <= session_recommender.SESSION_TOKEN_MAX_LENGTH:
+        return token
+    return None
+
+def record_session_view(request: Request, response: Response, post_id: int, current_user):
+    """Añade la lectura al historial de la sesión; a los anónimos sin sesión se les asigna una (cookie)"""
+    token = get_session_token(request)
+    if token is None:
+        if current_user:
+            return
+        token = session_recommender.new_session_token()
+        response.set_cookie(session_recommender.SESSION_COOKIE, token, httponly=True, samesite="lax")
+    session_recommender.sessions.record(token, post_id)
+
 @router.post("/{post_id}/visit", response_model=schemas.VisitOut)
-def record_visit(
+async def record_visit(
     post_id: int,
     request: Request,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
     current_user = Depends(get_optional_user)
 ):
     # Obtener la dirección IP del cliente
     client_ip = request.client.host if request.client else None
     
-    # Si el usuario está autenticado, registrar la visita con su ID
-    if current_user:
-        return crud.record_visit(db, post_id, current_user.id, client_ip)
-    else:
-        # Si es un visitante anónimo, registrar solo la IP
-        return crud.record_visit(db, post_id, None, client_ip)
+    # Si el usuario está autenticado, registrar la visita con su ID; si no, solo la IP
+    visit = await crud_async.record_visit(db, post_id, current_user.id if current_user else None, client_ip)
+    if not visit:
+        raise HTTPException(status_code=404, detail="Post not found")
+    record_session_view(request, response, post_id, current_user)
+    return visit
 
 @router.get("/{post_id}/visits", response_model=int)
 def get_post_visits(
@@ -261,59 +358,168 @@ def get_post_visits(
 
 import models
 from models import User
-from RecommendationSystem import recommendation_system
+from RecommendationSystem import SIMILAR_POSTS_N, recommendation_system
 from routers.auth import get_current_user
 
+# Plazo por defecto (ms) para el nivel del modelo; 0 = esperar siempre al modelo
+RECOMMENDATIONS_DEADLINE_MS = int(os.getenv("RECOMMENDATIONS_DEADLINE_MS", "200"))
+
 # Endpoint para obtener recomendaciones para un usuario
 @router.get("/user/{user_id}/recommendations", response_model=List[schemas.PostBase])
-def get_recommendations_for_user(user_id: int, n_recommendations: int = 4, db: Session = Depends(get_db)):
-    """Obtiene recomendaciones de posts para un usuario específico"""
+async def get_recommendations_for_user(user_id: int, n_recommendations: int = 4,
+                                       deadline_ms: Optional[int] = Query(None, ge=1),
+                                       db: AsyncSession = Depends(get_async_db)):
+    """Obtiene recomendaciones de posts para un usuario específico.
+
+    Por niveles: top-N precalculado; si no hay, el modelo (en el threadpool) con un plazo de
+    deadline_ms; si no termina a tiempo, el nivel heurístico en memoria. El cálculo del modelo
+    sigue en segundo plano y deja el resultado en la caché para la siguiente petición.
+    """
     print(f"Obteniendo recomendaciones para el usuario {user_id}")
-    
-    # Obtener recomendaciones básicas
-    recommendations = recommendation_system.get_recommendations_for_user(user_id, n_recommendations)
-    
-    # Obtener el usuario actual para verificar los likes
-    current_user = db.query(models.User).filter(models.User.id == user_id).first()
-    
-    # Enriquecer las recomendaciones con información de likes y visitas
-    for post in recommendations:
-        # Verificar si el usuario ha dado like a este post
-        post["isliked"] = db.query(models.Like).filter(
-            models.Like.post_id == post["id"],
-            models.Like.user_id == user_id
-        ).first() is not None
-        
-        # Actualizar contadores de likes y visitas
-        post["likes"] = db.query(models.Like).filter(models.Like.post_id == post["id"]).count()
-        post["visits"] = db.query(models.Visit).filter(models.Visit.post_id == post["id"]).count()
+    deadline_ms = deadline_ms or RECOMMENDATIONS_DEADLINE_MS
+    budget = load_shedding.Budget(load_shedding.RECOMMENDATIONS_BUDGET_MS)
+
+    # Primero el top-N precalculado por el batch (batch_recommendations.py), ya con contadores
+    recommendations = await crud_async.get_precomputed_recommendations(db, user_id, n_recommendations)
+    tier = "precomputed"
+    if recommendations is None:
+        # Obtener recomendaciones básicas (el sistema de recomendación es síncrono), con hueco en el limitador
+        limiter = load_shedding.recommendations
+        live = await limiter.submit(budget, recommendation_system.get_recommendations_for_user, user_id, n_recommendations)
+        tier = "model"
+        if live is not None:
+            wait = min(deadline_ms / 1000, budget.remaining()) if deadline_ms > 0 else budget.remaining()
+            try:
+                recommendations = await asyncio.wait_for(asyncio.shield(live), wait)
+            except asyncio.TimeoutError:
+                recommendations = await crud_async.get_heuristic_recommendations(db, user_id, n_recommendations)
+                if recommendations is not None:
+                    tier = "heuristic"
+                else:
+                    # Listas en memoria aún frías: esperar al modelo lo que quede de presupuesto
+                    try:
+                        recommendations = await asyncio.wait_for(asyncio.shield(live), budget.remaining())
+                    except asyncio.TimeoutError:
+                        limiter.degraded()
+
+        if recommendations is None:
+            # Cola llena o presupuesto agotado: populares cacheados en vez de calcular
+            recommendations = await crud_async.get_popular_posts(db, n_recommendations, user_id)
+            tier = "popular"
+        elif tier == "model":
+            # Enriquecer las recomendaciones con información de likes y visitas
+            await crud_async.enrich_posts(db, recommendations, user_id)
+    metrics.increment(f"recommendations.tier.{tier}")
     
     print(f"Se encontraron {len(recommendations)} recomendaciones")
     return recommendations
 
+# Recomendaciones por sesión (también para anónimos): co-visitas de sus últimas lecturas
+@router.get("/session/recommendations", response_model=List[schemas.PostBase])
+async def get_session_recommendations(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    n_recommendations: int = 4,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_optional_user)
+):
+    """Siguientes lecturas a partir del historial en memoria de la sesión; se completa con populares"""
+    covisitation = session_recommender.covisitation
+    if covisitation.stale:
+        # La primera vez se espera a la construcción; después se reconstruye tras responder
+        if covisitation.built:
+            background_tasks.add_task(run_in_threadpool, build_covisitation)
+        else:
+            await run_in_threadpool(build_covisitation)
+    token = get_session_token(request)
+    views = session_recommender.sessions.recent(token) if token else []
+    post_ids = session_recommender.recommend(views, n_recommendations)
+    user_id = current_user.id if current_user else None
+    recommendations = await crud_async.get_posts_by_ids(db, post_ids, user_id, excerpt=True)
+    metrics.increment("recommendations.session" if recommendations else "recommendations.session_empty")
+    if len(recommendations) < n_recommendations:
+        recommendations += await crud_async.get_popular_posts(
+            db, n_recommendations - len(recommendations), user_id, exclude=views + post_ids
+        )
+    return recommendations
+
+def build_covisitation():
+    with ReadSessionLocal() as db:
+        session_recommender.covisitation.build(db)
+
+async def similar_posts_within_budget(post_id: int, n: int) -> Optional[List[dict]]:
+    """Posts similares bajo el limitador de concurrencia y el presupuesto; None si hay que degradar"""
+    budget = load_shedding.Budget(load_shedding.SIMILAR_BUDGET_MS)
+    future = await load_shedding.similar.submit(budget, recommendation_system.get_similar_posts, post_id, n)
+    if future is None:
+        return None
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), budget.remaining())
+    except asyncio.TimeoutError:
+        load_shedding.similar.degraded()
+        return None
+
 # Endpoint para obtener posts similares a un post específico
 @router.get("/{post_id}/similar", response_model=List[schemas.PostBase])
-def get_similar_posts(post_id: int, n_recommendations: int = 5, db: Session = Depends(get_db), current_user = Depends(get_optional_user)):
+async def get_similar_posts(post_id: int, n_recommendations: int = SIMILAR_POSTS_N, db: AsyncSession = Depends(get_async_db), current_user = Depends(get_optional_user)):
     """Obtiene posts similares a un post específico"""
     print(f"Obteniendo posts similares al post {post_id}")
     
-    # Obtener posts similares
-    similar_posts = recommendation_system.get_similar_posts(post_id, n_recommendations)
+    # Anónimo: respuesta ya serializada si los datos no han cambiado
+    cache_key = None
+    if not current_user:
+        cache_key = ("similar", post_id, n_recommendations, await http_cache.posts_version(db))
+        body = response_cache.get(cache_key)
+        if body is not None:
+            return json_response(body)
     
-    # Enriquecer los posts similares con información de likes y visitas
-    for post in similar_posts:
-        # Verificar si el usuario ha dado like a este post (si está autenticado)
-        if current_user:
-            post["isliked"] = db.query(models.Like).filter(
-                models.Like.post_id == post["id"],
-                models.Like.user_id == current_user.id
-            ).first() is not None
-        else:
-            post["isliked"] = False
-        
-        # Actualizar contadores de likes y visitas
-        post["likes"] = db.query(models.Like).filter(models.Like.post_id == post["id"]).count()
-        post["visits"] = db.query(models.Visit).filter(models.Visit.post_id == post["id"]).count()
+    # Obtener posts similares (o los populares si hay sobrecarga)
+    similar_posts = await similar_posts_within_budget(post_id, n_recommendations)
+    if similar_posts is None:
+        similar_posts = await crud_async.get_popular_posts(db, n_recommendations, current_user.id if current_user else None,
+                                                           exclude=(post_id,))
+        # Respuesta degradada: no se guarda en la caché
+        cache_key = None
+    else:
+        # Enriquecer los posts similares con información de likes y visitas
+        await crud_async.enrich_posts(db, similar_posts, current_user.id if current_user else None)
     
     print(f"Se encontraron {len(similar_posts)} posts similares")
-    return similar_posts
\ No newline at end of file
+    if cache_key:
+        body = encode_response(similar_posts)
+        response_cache.put(cache_key, body)
+        return json_response(body)
+    return similar_posts
+
+async def record_visit_in_background(post_id: int, user_id: Optional[int], ip_address: Optional[str]):
+    # Sesión propia: la de la petición ya está cerrada cuando se ejecuta la tarea
+    async with AsyncSessionLocal() as db:
+        await crud_async.record_visit(db, post_id, user_id, ip_address)
+
+# Endpoint combinado para abrir un artículo: post + visita + posts similares
+@router.get("/{post_id}/page", response_model=schemas.PostPage)
+async def read_post_page(
+    post_id: int,
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    n_similar: int = SIMILAR_POSTS_N,
+    db: AsyncSession = Depends(get_async_db),
+    current_user = Depends(get_optional_user)
+):
+    """Sustituye GET /{id}, POST /{id}/visit y GET /{id}/similar con una sola petición"""
+    current_user_id = current_user.id if current_user else None
+    
+    similar_posts = await similar_posts_within_budget(post_id, n_similar)
+    if similar_posts is None:
+        similar_posts = await crud_async.get_popular_posts(db, n_similar, current_user_id, exclude=(post_id,))
+    page = await crud_async.get_post_page(db, post_id, similar_posts, current_user_id)
+    if not page:
+        raise HTTPException(status_code=404, detail="Post not found")
+    
+    # La visita se registra después de responder; el contador ya la incluye
+    client_ip = request.client.host if request.client else None
+    background_tasks.add_task(record_visit_in_background, post_id, current_user_id, client_ip)
+    record_session_view(request, response, post_id, current_user)
+    page["post"]["visits"] += 1
+    return page
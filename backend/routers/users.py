@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select, union_all
 import schemas, crud, models
-from database import SessionLocal
+from database import get_db, get_read_db
 from typing import List, Dict, Any
 from routers.posts import get_optional_user
 from routers.auth import get_current_user
@@ -10,13 +10,6 @@ from datetime import datetime, timedelta
 
 router = APIRouter()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 @router.post("/", response_model=schemas.UserOut)
 def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return crud.create_user(db, user)
@@ -26,7 +19,7 @@ def read_users(db: Session = Depends(get_db)):
     return crud.get_users(db)
 
 @router.get("/{user_id}/stats")
-def get_user_stats(user_id: int, db: Session = Depends(get_db), current_user = Depends(get_optional_user)):
+def get_user_stats(user_id: int, db: Session = Depends(get_read_db), current_user = Depends(get_optional_user)):
     # Verificar que el usuario existe
     user = db.query(models.User).filter(models.User.id == user_id).first()
     if not user:
@@ -41,29 +34,24 @@ def get_user_stats(user_id: int, db: Session = Depends(get_db), current_user = D
     # Obtener total de visitas del usuario
     total_visits = db.query(models.Visit).filter(models.Visit.user_id == user_id).count()
     
-    # Obtener categorías favoritas (basado en likes y visitas)
-    # Primero, obtenemos los posts que el usuario ha dado like
-    liked_posts = db.query(models.Post).join(models.Like, models.Like.post_id == models.Post.id)\
-                    .filter(models.Like.user_id == user_id).all()
-    
-    # Luego, obtenemos los posts que el usuario ha visitado
-    visited_posts = db.query(models.Post).join(models.Visit, models.Visit.post_id == models.Post.id)\
-                    .filter(models.Visit.user_id == user_id).all()
-    
-    # Combinamos ambos conjuntos de posts
-    all_interaction_posts = liked_posts + visited_posts
-    
-    # Contamos las categorías
-    category_counts = {}
-    for post in all_interaction_posts:
-        if post.categorie:
-            if post.categorie in category_counts:
-                category_counts[post.categorie] += 1
-            else:
-                category_counts[post.categorie] = 1
-    
-    # Convertimos a lista de diccionarios y ordenamos por conteo
-    favorite_categories = [{'category': cat, 'count': count} for cat, count in category_counts.items()]
+    # Categorías favoritas: número de likes + visitas por categoría (agrupado en la BD) y,
+    # en "score", la afinidad decaída del perfil (likes x3, visitas x1)
+    interactions = union_all(
+        select(models.Like.post_id).where(models.Like.user_id == user_id),
+        select(models.Visit.post_id).where(models.Visit.user_id == user_id),
+    ).subquery()
+    counts = db.execute(
+        select(models.Post.category_id, func.count())
+        .join(interactions, interactions.c.post_id == models.Post.id)
+        .where(models.Post.category_id != None)
+        .group_by(models.Post.category_id)
+    ).all()
+    affinity = dict(crud.get_user_category_affinity(db, user_id))
+    category_names = crud.get_category_names(db, [category_id for category_id, _ in counts])
+    favorite_categories = [
+        {'category': category_names.get(category_id), 'count': count, 'score': round(affinity.get(category_id, 0.0), 2)}
+        for category_id, count in counts
+    ]
     favorite_categories.sort(key=lambda x: x['count'], reverse=True)
     
     return {
@@ -76,7 +64,7 @@ def get_user_stats(user_id: int, db: Session = Depends(get_db), current_user = D
     }
 
 @router.get("/analytics/power-bi")
-def get_global_analytics_data(api_key: str = None, db: Session = Depends(get_db)):
+def get_global_analytics_data(api_key: str = None, db: Session = Depends(get_read_db)):
     # Verificar la clave API (una clave simple para demostración)
     # En producción, deberías usar un sistema más seguro de gestión de claves API
     if api_key == "pfe2025_test":
@@ -114,6 +102,7 @@ def get_global_analytics_data(api_key: str = None, db: Session = Depends(get_db)
             "id": post.id,
             "title": post.title,
             "categorie": post.categorie,
+            "category_id": post.category_id,
             "user_id": post.user_id,
             "created_at": post.created_at,
             "likes_count": db.query(models.Like).filter(models.Like.post_id == post.id).count(),
@@ -148,20 +137,22 @@ def get_global_analytics_data(api_key: str = None, db: Session = Depends(get_db)
     
     # Estadísticas por categoría
     category_stats = db.query(
-        models.Post.categorie,
+        models.Post.category_id,
         func.count(models.Post.id).label('post_count'),
         func.count(models.Like.id).label('like_count'),
         func.count(models.Visit.id).label('visit_count')
     ).outerjoin(models.Like, models.Like.post_id == models.Post.id)\
      .outerjoin(models.Visit, models.Visit.post_id == models.Post.id)\
-     .filter(models.Post.categorie != None)\
-     .group_by(models.Post.categorie)\
+     .filter(models.Post.category_id != None)\
+     .group_by(models.Post.category_id)\
      .all()
     
+    category_names = crud.get_category_names(db, [row.category_id for row in category_stats])
     categories_data = []
-    for cat, post_count, like_count, visit_count in category_stats:
+    for category_id, post_count, like_count, visit_count in category_stats:
         cat_data = {
-            "categorie": cat,
+            "category_id": category_id,
+            "categorie": category_names.get(category_id),
             "post_count": post_count,
             "like_count": like_count,
             "visit_count": visit_count,
@@ -1,9 +1,12 @@
 import time
-import subprocess
 import logging
 import schedule
 from datetime import datetime
 
+# Las importaciones (pandas, sklearn, SQLAlchemy) se hacen una sola vez: el worker vive
+# tanto como el proceso y entrena dentro de él, sin lanzar un subproceso por ejecución
+import training
+
 # Configurar el logging
 logging.basicConfig(
     level=logging.INFO,
@@ -17,19 +20,11 @@ logging.basicConfig(
 logger = logging.getLogger("ScheduledTraining")
 
 def run_training():
-    """Ejecuta el script de entrenamiento del sistema de recomendación"""
+    """Actualiza el sistema de recomendación (se omite si nada cambió o si otro proceso ya entrena)"""
     logger.info(f"Iniciando entrenamiento programado: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     try:
-        result = subprocess.run(
-            ["python", "train_recommendation_system.py"], 
-            capture_output=True, 
-            text=True
-        )
-        if result.returncode == 0:
-            logger.info("Entrenamiento completado exitosamente")
-            logger.info(f"Salida: {result.stdout}")
-        else:
-            logger.error(f"Error durante el entrenamiento: {result.stderr}")
+        status = training.run_training()
+        logger.info(f"Resultado del entrenamiento: {status}")
     except Exception as e:
         logger.error(f"Excepción durante el entrenamiento: {str(e)}")
 
@@ -39,12 +34,9 @@ def main():
     # Ejecutar el entrenamiento inmediatamente al iniciar
     run_training()
     
-    # Programar el entrenamiento para ejecutarse cada 5 minutos (para pruebas)
-    schedule.every(5).minutes.do(run_training)
-    
-    # Comentado para pruebas
-    # Programar el entrenamiento para ejecutarse cada 12 horas
-    # schedule.every(12).hours.do(run_training)
+    # Comprobar cada TRAINING_POLL_SECONDS si hay actividad nueva: fold-in si es poca,
+    # reajuste completo si supera TRAINING_REFIT_THRESHOLD o el modelo es demasiado antiguo
+    schedule.every(training.TRAINING_POLL_SECONDS).seconds.do(run_training)
     
     # Programar el entrenamiento para ejecutarse a las 3:00 AM todos los días
     # schedule.every().day.at("03:00").do(run_training)
@@ -52,7 +44,7 @@ def main():
     # Bucle principal para mantener el programa en ejecución
     while True:
         schedule.run_pending()
-        time.sleep(60)  # Verificar cada minuto si hay tareas pendientes
+        time.sleep(10)  # Verificar cada 10 segundos si hay tareas pendientes
 
 if __name__ == "__main__":
     main()
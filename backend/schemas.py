@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List
 
 # ====== User ======
 class UserBase(BaseModel):
@@ -50,6 +50,28 @@ class PostOut(PostBase):
     class Config:
         orm_mode = True
 
+# Página de detalle: post + posts similares en una sola respuesta
+class PostPage(BaseModel):
+    post: PostOut
+    similar: List[PostBase] = []
+
+# Categoría con su número de posts (GET /api/categories)
+class CategoryCount(BaseModel):
+    id: int
+    categorie: str
+    count: int
+
+# Búsqueda de texto completo (GET /api/posts/search)
+class SearchHit(PostOut):
+    score: float
+
+class SearchResults(BaseModel):
+    query: str
+    total: int
+    page: int
+    page_size: int
+    results: List[SearchHit] = []
+
 # Este comentario se elimina ya que la clase LikeOut se define más abajo
 
 # ====== Like ======
@@ -95,4 +117,6 @@ class Token(BaseModel):
     is_admin: bool = False
 
 class TokenData(BaseModel):
-    username: Optional[str] = None
\ No newline at end of file
+    username: Optional[str] = None
+    user_id: Optional[int] = None
+    is_admin: bool = False
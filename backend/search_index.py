@@ -0,0 +1,183 @@
+import heapq
+import html
+import math
+import os
+import pickle
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import metrics
+import models
+
+# Búsqueda de texto completo: índice invertido en memoria sobre título + texto plano, ranking BM25
+SEARCH_INDEX_PATH = os.getenv(
+    "SEARCH_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_index.pickle"),
+)
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+# Cada aparición en el título cuenta como varias en el contenido
+SEARCH_TITLE_WEIGHT = int(os.getenv("SEARCH_TITLE_WEIGHT", "3"))
+
+SNAPSHOT_VERSION = 1
+
+# Palabras vacías del francés (ya sin acentos, tras fold)
+STOPWORDS = frozenset("""
+au aux avec ce ces cette dans de des du elle en est et etre il ils je la le les leur leurs
+lui mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses son
+sont sur ta te tes toi ton tu un une vos votre vous plus comme tout tous aussi ainsi donc
+peut sans entre tres
+""".split())
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss"})
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos (Génie Électrique -> genie electrique)"""
+    text = text.lower().translate(_LIGATURES)
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+def plain_text(content: str) -> str:
+    """Quita etiquetas HTML y entidades; los signos de markdown los descarta el tokenizador"""
+    return html.unescape(_TAG_RE.sub(" ", content or ""))
+
+def tokenize(text: str) -> List[str]:
+    # Las elisiones (l', d', qu') quedan como tokens de una letra o palabras vacías
+    return [t for t in _TOKEN_RE.findall(fold(text)) if len(t) > 1 and t not in STOPWORDS]
+
+class SearchIndex:
+    """Índice invertido término -> {post_id: frecuencia}. Seguro entre hilos"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.doc_lengths: Dict[int, int] = {}
+        self.total_length = 0
+        self.dirty = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    @property
+    def max_post_id(self) -> int:
+        return max(self.doc_lengths, default=0)
+
+    def _remove(self, post_id: int):
+        length = self.doc_lengths.pop(post_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in [t for t, docs in self.postings.items() if post_id in docs]:
+            docs = self.postings[term]
+            del docs[post_id]
+            if not docs:
+                del self.postings[term]
+
+    def add_post(self, post_id: int, title: str, content: str):
+        """Indexa (o reindexa) un post"""
+        frequencies = Counter(tokenize(plain_text(content)))
+        for term in tokenize(title or ""):
+            frequencies[term] += SEARCH_TITLE_WEIGHT
+        length = sum(frequencies.values())
+        with self._lock:
+            self._remove(post_id)
+            for term, tf in frequencies.items():
+                self.postings.setdefault(term, {})[post_id] = tf
+            self.doc_lengths[post_id] = length
+            self.total_length += length
+            self.dirty = True
+            metrics.set_gauge("search.documents", len(self.doc_lengths))
+
+    def remove_post(self, post_id: int):
+        with self._lock:
+            self._remove(post_id)
+            self.dirty = True
+            metrics.set_gauge("search.documents", len(self.doc_lengths))
+
+    def rebuild(self, posts: Iterable[Tuple[int, str, str]]):
+        """Reconstruye el índice completo a partir de (id, título, contenido)"""
+        with self._lock:
+            self.postings = {}
+            self.doc_lengths = {}
+            self.total_length = 0
+        for post_id, title, content in posts:
+            self.add_post(post_id, title, content)
+        self.dirty = True
+
+    def search(self, query: str, offset: int = 0, limit: int = 10) -> Tuple[int, List[Tuple[int, float]]]:
+        """Devuelve (total de coincidencias, [(post_id, puntuación)]) de la página pedida"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self.doc_lengths)
+            if not terms or not n_docs:
+                return 0, []
+            avg_length = self.total_length / n_docs
+            scores: Dict[int, float] = {}
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for post_id, tf in docs.items():
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[post_id] / avg_length)
+                    scores[post_id] = scores.get(post_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+        # A igual puntuación, primero los posts más recientes
+        top = heapq.nlargest(offset + limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return len(scores), top[offset:]
+
+    # ====== SNAPSHOT ======
+    def save(self, path: str = SEARCH_INDEX_PATH):
+        """Guarda el índice en disco (escritura atómica) si cambió desde la última vez"""
+        with self._lock:
+            if not self.dirty:
+                return
+            data = {
+                "version": SNAPSHOT_VERSION,
+                "postings": self.postings,
+                "doc_lengths": self.doc_lengths,
+            }
+            payload = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+            self.dirty = False
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str = SEARCH_INDEX_PATH) -> bool:
+        """Carga un snapshot; False si no existe o no es de esta versión"""
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            return False
+        with self._lock:
+            self.postings = data["postings"]
+            self.doc_lengths = data["doc_lengths"]
+            self.total_length = sum(self.doc_lengths.values())
+            self.dirty = False
+            metrics.set_gauge("search.documents", len(self.doc_lengths))
+        return True
+
+index = SearchIndex()
+
+def load_or_build(db):
+    """Al arrancar: carga el snapshot y lo pone al día con los posts creados después.
+
+    Si el snapshot no cuadra con la BD (posts borrados o snapshot ajeno) se reconstruye entero.
+    """
+    with metrics.timer("search.load_ms"):
+        loaded = index.load()
+        known = db.query(models.Post.id).filter(models.Post.id <= index.max_post_id).count() if loaded else None
+        if not loaded or known != len(index):
+            index.rebuild(db.query(models.Post.id, models.Post.title, models.Post.content).yield_per(500))
+        else:
+            for post_id, title, content in (db.query(models.Post.id, models.Post.title, models.Post.content)
+                                            .filter(models.Post.id > index.max_post_id).yield_per(500)):
+                index.add_post(post_id, title, content)
+        index.save()
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+import metrics
+
+# Coste de bcrypt (log2 de las rondas). Los hashes con menos rondas se actualizan al hacer login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hilos dedicados al hashing y máximo de operaciones en espera antes de rechazar
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
+
+# Executor acotado: bcrypt no ocupa el event loop ni el threadpool general de FastAPI
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_pending = 0
+_pending_lock = threading.Lock()
+
+class PasswordHasherBusy(Exception):
+    """Hay demasiadas operaciones de hashing en cola"""
+
+def verify_password(plain_password, hashed_password):
+    return pwd_context.verify(plain_password, hashed_password)
+
+def get_password_hash(password):
+    return pwd_context.hash(password)
+
+def _verify_and_upgrade(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    if not pwd_context.verify(plain_password, hashed_password):
+        return False, None
+    # Rehash con el coste actual si el hash guardado quedó desactualizado
+    if pwd_context.needs_update(hashed_password):
+        return True, pwd_context.hash(plain_password)
+    return True, None
+
+async def _run_bounded(func, *args):
+    """Ejecuta func en el executor de hashing, rechazando si la cola está llena"""
+    global _pending
+    with _pending_lock:
+        if _pending >= PASSWORD_HASH_MAX_PENDING:
+            metrics.increment("auth.hash.rejected")
+            raise PasswordHasherBusy()
+        _pending += 1
+        metrics.set_gauge("auth.hash.pending", _pending)
+
+    enqueued_at = time.perf_counter()
+
+    def job():
+        started_at = time.perf_counter()
+        metrics.observe("auth.hash.queue_wait_ms", (started_at - enqueued_at) * 1000)
+        try:
+            return func(*args)
+        finally:
+            metrics.observe("auth.hash.time_ms", (time.perf_counter() - started_at) * 1000)
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, job)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+            metrics.set_gauge("auth.hash.pending", _pending)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_bounded(get_password_hash, password)
+
+async def verify_and_upgrade_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verifica la contraseña y devuelve (válida, nuevo_hash o None)"""
+    return await _run_bounded(_verify_and_upgrade, plain_password, hashed_password)
@@ -42,7 +42,9 @@ def get_image_name(nom_filiere: str) -> str:
         
     }
     
-    return f"""/media/{mapping.get(nom_filiere, "default.jpg")}""" 
+    # Comparar por la forma canónica: "d’Information" y "d'Information" son la misma categoría
+    mapping = {crud.category_slug(name): image for name, image in mapping.items()}
+    return f"""/media/{mapping.get(crud.category_slug(nom_filiere), "default.jpg")}""" 
 
 def load_articles_from_json(directory):
     articles = []
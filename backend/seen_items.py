@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+
+# Posts con los que cada usuario ha interactuado (likes o visitas), como array int32 ordenado:
+# se carga una vez por usuario, se actualiza al registrar interacciones y se filtra en numpy
+SEEN_CACHE_USERS = int(os.getenv("SEEN_CACHE_USERS", "10000"))
+# Recarga periódica: las interacciones registradas en otros procesos no llegan por add()
+SEEN_CACHE_TTL = int(os.getenv("SEEN_CACHE_TTL", "300"))
+
+def _query(user_id: int):
+    return select(models.Like.post_id).where(models.Like.user_id == user_id)\
+        .union(select(models.Visit.post_id).where(models.Visit.user_id == user_id))
+
+def _to_array(post_ids) -> np.ndarray:
+    return np.unique(np.asarray(post_ids, dtype=np.int32))
+
+def contains(seen: np.ndarray, post_ids: np.ndarray) -> np.ndarray:
+    """Máscara de los post_ids presentes en seen (búsqueda binaria sobre el array ordenado)"""
+    post_ids = np.asarray(post_ids, dtype=np.int64)
+    if len(seen) == 0:
+        return np.zeros(len(post_ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(seen, post_ids), len(seen) - 1)
+    return seen[positions] == post_ids
+
+class SeenItems:
+    """LRU user_id -> (array ordenado de post_ids, instante de carga). Segura entre hilos"""
+
+    def __init__(self, max_users: int = SEEN_CACHE_USERS, ttl: int = SEEN_CACHE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, user_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[1] > self.ttl:
+                metrics.increment("seen_items.miss")
+                return None
+            self._entries.move_to_end(user_id)
+        metrics.increment("seen_items.hit")
+        return entry[0]
+
+    def _store(self, user_id: int, seen: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._entries[user_id] = (seen, time.monotonic())
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return seen
+
+    def get(self, db: Session, user_id: int) -> np.ndarray:
+        seen = self._cached(user_id)
+        if seen is None:
+            seen = self._store(user_id, _to_array(db.execute(_query(user_id)).scalars().all()))
+        return seen
+
+    async def get_async(self, db: AsyncSession, user_id: int) -> np.ndarray:
+        seen = self._cached(user_id)
+        if seen is None:
+            result = await db.execute(_query(user_id))
+            seen = self._store(user_id, _to_array(result.scalars().all()))
+        return seen
+
+    def add(self, user_id: Optional[int], post_id: int):
+        """Tras un like o una visita: inserta en orden si el usuario está cargado"""
+        if not user_id:
+            return
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            seen, loaded_at = entry
+            position = np.searchsorted(seen, post_id)
+            if position < len(seen) and seen[position] == post_id:
+                return
+            # Array nuevo: los lectores pueden estar usando el anterior
+            self._entries[user_id] = (np.insert(seen, position, post_id).astype(np.int32), loaded_at)
+
+    def invalidate(self, user_id: int):
+        """Quitar un like no basta para sacar el post (puede seguir visitado): se recarga"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+cache = SeenItems()
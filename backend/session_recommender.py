@@ -0,0 +1,161 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import metrics
+import models
+import recommender_model
+
+# Recomendaciones para visitantes anónimos: últimas lecturas de cada sesión (anillo en memoria,
+# LRU sobre sesiones) + estructura de co-visitas "quien leyó A leyó después B"
+SESSION_COOKIE = "session_id"
+SESSION_HEADER = "X-Session-Id"
+SESSION_TOKEN_MAX_LENGTH = 64
+SESSION_HISTORY = int(os.getenv("SESSION_HISTORY", "10"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "50000"))
+# Co-visitas: vecinos guardados por post, lecturas siguientes que cuentan y ventana de visitas
+COVISIT_TOP_K = int(os.getenv("COVISIT_TOP_K", "20"))
+COVISIT_WINDOW = int(os.getenv("COVISIT_WINDOW", "3"))
+COVISIT_DAYS = int(os.getenv("COVISIT_DAYS", "30"))
+COVISIT_REFRESH_SECONDS = int(os.getenv("COVISIT_REFRESH_SECONDS", "600"))
+
+def new_session_token() -> str:
+    return secrets.token_urlsafe(16)
+
+class SessionStore:
+    """token -> deque con los últimos SESSION_HISTORY posts vistos (el más reciente al final). Segura entre hilos"""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, history: int = SESSION_HISTORY):
+        self.max_sessions = max_sessions
+        self.history = history
+        self._sessions: "OrderedDict[str, Deque[int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def record(self, token: str, post_id: int):
+        with self._lock:
+            views = self._sessions.get(token)
+            if views is None:
+                views = self._sessions[token] = deque(maxlen=self.history)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(token)
+            if views and views[-1] == post_id:
+                return
+            views.append(post_id)
+            metrics.set_gauge("sessions.active", len(self._sessions))
+
+    def recent(self, token: str) -> List[int]:
+        """Posts vistos por la sesión, del más reciente al más antiguo"""
+        with self._lock:
+            views = self._sessions.get(token)
+            if views is None:
+                return []
+            self._sessions.move_to_end(token)
+            return list(reversed(views))
+
+class CoVisitation:
+    """post -> (vecinos, pesos) con los COVISIT_TOP_K posts más leídos a continuación.
+
+    Se construye en bloque con numpy a partir de las visitas recientes (usuarios registrados por
+    user_id, anónimos por IP) y se reconstruye cada COVISIT_REFRESH_SECONDS.
+    """
+
+    def __init__(self):
+        self._neighbors: Optional[Dict[int, Tuple[np.ndarray, np.ndarray]]] = None
+        self._built_at = 0.0
+        self._build_lock = threading.Lock()
+
+    @property
+    def built(self) -> bool:
+        return self._neighbors is not None
+
+    @property
+    def stale(self) -> bool:
+        return self._neighbors is None or time.monotonic() - self._built_at > COVISIT_REFRESH_SECONDS
+
+    def build(self, db: Session):
+        if not self._build_lock.acquire(blocking=False):
+            return
+        try:
+            with metrics.timer("covisitation.build_ms"):
+                neighbors = _build_neighbors(db)
+            self._neighbors, self._built_at = neighbors, time.monotonic()
+            metrics.set_gauge("covisitation.posts", len(neighbors))
+        finally:
+            self._build_lock.release()
+
+    def neighbors(self, post_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        return (self._neighbors or {}).get(post_id, empty)
+
+def _build_neighbors(db: Session) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+    since = datetime.now() - timedelta(days=COVISIT_DAYS)
+    rows = db.execute(
+        select(models.Visit.user_id, models.Visit.ip_address, models.Visit.post_id, models.Visit.visit_date)
+        .where(models.Visit.visit_date >= since)
+    ).all()
+    if not rows:
+        return {}
+    visitors = np.array([f"u{user_id}" if user_id is not None else f"ip{ip}" for user_id, ip, _, _ in rows])
+    _, visitor_codes = np.unique(visitors, return_inverse=True)
+    post_ids = np.array([post_id for _, _, post_id, _ in rows], dtype=np.int64)
+    dates = recommender_model.to_datetime64([date for _, _, _, date in rows])
+    # Visitas de cada visitante en orden cronológico
+    order = np.lexsort((dates, visitor_codes))
+    visitor_codes, post_ids = visitor_codes[order], post_ids[order]
+
+    # Pares (A, B) con B entre las COVISIT_WINDOW lecturas siguientes a A del mismo visitante;
+    # pesan 1/distancia y cuentan en los dos sentidos
+    sources, targets, weights = [], [], []
+    for offset in range(1, COVISIT_WINDOW + 1):
+        same = (visitor_codes[offset:] == visitor_codes[:-offset]) & (post_ids[offset:] != post_ids[:-offset])
+        a, b = post_ids[:-offset][same], post_ids[offset:][same]
+        sources += [a, b]
+        targets += [b, a]
+        weights.append(np.full(2 * len(a), 1.0 / offset))
+    sources, targets, weights = np.concatenate(sources), np.concatenate(targets), np.concatenate(weights)
+    if not len(sources):
+        return {}
+    pairs, inverse = np.unique(np.stack([sources, targets], axis=1), axis=0, return_inverse=True)
+    totals = np.bincount(inverse.ravel(), weights=weights, minlength=len(pairs))
+
+    # Top-K vecinos por post: orden por origen y peso descendente, puesto dentro del origen
+    order = np.lexsort((-totals, pairs[:, 0]))
+    pairs, totals = pairs[order], totals[order]
+    starts = np.flatnonzero(np.r_[True, pairs[1:, 0] != pairs[:-1, 0]])
+    ends = np.r_[starts[1:], len(pairs)]
+    return {
+        int(pairs[start, 0]): (pairs[start:min(end, start + COVISIT_TOP_K), 1], totals[start:min(end, start + COVISIT_TOP_K)])
+        for start, end in zip(starts, ends)
+    }
+
+def recommend(views: List[int], n: int) -> List[int]:
+    """Siguientes lecturas para una sesión (views: del más reciente al más antiguo).
+
+    Suma los pesos de co-visita de los vecinos de cada vista, con más peso a las recientes:
+    O(SESSION_HISTORY * COVISIT_TOP_K), sin tocar la BD.
+    """
+    scores: Dict[int, float] = {}
+    for position, post_id in enumerate(views):
+        neighbor_ids, neighbor_weights = covisitation.neighbors(post_id)
+        recency = 1.0 / (position + 1)
+        for neighbor_id, weight in zip(neighbor_ids.tolist(), neighbor_weights.tolist()):
+            scores[neighbor_id] = scores.get(neighbor_id, 0.0) + weight * recency
+    for post_id in views:
+        scores.pop(post_id, None)
+    return [post_id for post_id, _ in sorted(scores.items(), key=lambda item: (-item[1], -item[0]))[:n]]
+
+sessions = SessionStore()
+covisitation = CoVisitation()
@@ -1,14 +1,18 @@
 import pandas as pd
 import numpy as np
 import logging
+import sys
 from datetime import datetime, timedelta
+from sqlalchemy import distinct, func
 from sqlalchemy.orm import Session
 from typing import List, Dict
 
 # Importar modelos y sistema de recomendación
-from models import User, Post, Like, Visit
-from database import SessionLocal, engine, Base
+from models import User, Post, Like, Visit, UserRecommendation
+from database import ReadSessionLocal, SessionLocal, engine, Base
 from RecommendationSystem import recommendation_system
+import batch_recommendations
+import training
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -18,8 +22,8 @@ def test_recommendations():
     """
     Probar el sistema de recomendación con los datos de muestra
     """
-    # Crear una sesión de base de datos
-    db = SessionLocal()
+    # Crear una sesión de base de datos (motor de lectura)
+    db = ReadSessionLocal()
     
     # Obtener todos los usuarios
     users = db.query(User).all()
@@ -59,21 +63,30 @@ def test_recommendations():
     
     db.close()
 
+def precompute_all():
+    """
+    Trabajo batch: entrena el modelo y precalcula el top-N de todos los usuarios en paralelo
+    """
+    status = training.run_training(force=True)
+    logger.info(f"Entrenamiento: {status}")
+    if status != "ok" or not batch_recommendations.RECOMMENDATIONS_PRECOMPUTE_ENABLED:
+        # run_training solo precalcula tras un entrenamiento correcto y con el precálculo activado
+        with SessionLocal() as db:
+            batch_recommendations.run_batch(db)
+    with ReadSessionLocal() as db:
+        n_rows, n_users = db.query(func.count(), func.count(distinct(UserRecommendation.user_id))).one()
+    logger.info(f"{n_rows} recomendaciones precalculadas para {n_users} usuarios")
+
 def main():
-    # Probar el sistema de recomendación con los datos existentes
-    logger.info("Iniciando prueba del sistema de recomendación con datos existentes...")
-    
-    # Invalidar el caché para asegurar recomendaciones actualizadas
-    recommendation_system.invalidate_cache()
-    
-    # Probar el sistema de recomendación
-    test_recommendations()
-    
-    logger.info("\nPrueba del sistema de recomendación completada.")
-    logger.info("Las recomendaciones ahora estarán actualizadas en la aplicación.")
-    logger.info("Puedes probar las recomendaciones en la interfaz de usuario.")
-    logger.info("Recuerda que las recomendaciones mejoran con más interacciones de usuarios.")
-    logger.info("Cuantos más likes y visitas haya, mejores serán las recomendaciones.")
+    # Por defecto, trabajo batch; con --test se recorren los usuarios mostrando sus recomendaciones
+    if "--test" in sys.argv:
+        logger.info("Iniciando prueba del sistema de recomendación con datos existentes...")
+        recommendation_system.invalidate_cache()
+        test_recommendations()
+        logger.info("\nPrueba del sistema de recomendación completada.")
+        return
+    logger.info("Precalculando las recomendaciones de todos los usuarios...")
+    precompute_all()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from starlette.concurrency import run_in_threadpool
+
+import batch_recommendations
+import metrics
+import models
+import recommender_model
+from database import SessionLocal, ReadSessionLocal
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Entrenamiento del recomendador dentro del proceso (lifespan de la API o worker de scheduled_training.py)
+TRAINING_SCHEDULER_ENABLED = os.getenv("TRAINING_SCHEDULER_ENABLED", "1") == "1"
+# Cada cuánto se mira si hay interacciones nuevas (consulta barata; solo se entrena si las hay)
+TRAINING_POLL_SECONDS = int(os.getenv("TRAINING_POLL_SECONDS", "30"))
+# Reajuste completo a partir de este número de cambios o de esta antigüedad; por debajo, fold-in
+TRAINING_REFIT_THRESHOLD = int(os.getenv("TRAINING_REFIT_THRESHOLD", "500"))
+TRAINING_MAX_AGE_SECONDS = int(os.getenv("TRAINING_MAX_AGE_SECONDS", str(6 * 3600)))
+TRAINING_LOCK_PATH = os.getenv("TRAINING_LOCK_PATH", recommender_model.RECOMMENDER_MODEL_PATH + ".lock")
+
+logger = logging.getLogger("training")
+
+class FileLock:
+    """Cerrojo exclusivo entre procesos sobre un fichero; acquire() no bloquea"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        self._file = open(self.path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+
+def last_successful_run(db) -> Optional[models.TrainingRun]:
+    return db.query(models.TrainingRun).filter(models.TrainingRun.status == "ok")\
+             .order_by(models.TrainingRun.id.desc()).first()
+
+def _run_high_water(run: models.TrainingRun) -> dict:
+    return {
+        "like_max_id": run.like_max_id, "like_count": run.like_count,
+        "visit_max_id": run.visit_max_id, "visit_count": run.visit_count,
+        "post_max_id": run.post_max_id, "post_count": run.post_count,
+    }
+
+def interaction_delta(before: dict, after: dict) -> int:
+    """Filas nuevas más filas borradas de likes, visitas y posts entre dos marcas de agua"""
+    delta = 0
+    for table in ("like", "visit", "post"):
+        added = max(after[f"{table}_max_id"] - (before[f"{table}_max_id"] or 0), 0)
+        removed = max(added - (after[f"{table}_count"] - (before[f"{table}_count"] or 0)), 0)
+        delta += added + removed
+    return delta
+
+def run_training(force: bool = False) -> str:
+    """Entrena y publica el modelo. Devuelve ok, error, skipped (nada cambió) o locked (otro proceso entrena).
+
+    Con pocos cambios desde el último entrenamiento se hace fold-in sobre el modelo actual;
+    el reajuste completo se reserva para force, TRAINING_REFIT_THRESHOLD o TRAINING_MAX_AGE_SECONDS.
+    """
+    lock = FileLock(TRAINING_LOCK_PATH)
+    if not lock.acquire():
+        metrics.increment("training.locked")
+        return "locked"
+    try:
+        with ReadSessionLocal() as read_db, SessionLocal() as db:
+            high_water = recommender_model.interaction_high_water(read_db)
+            last_run = last_successful_run(db)
+            current = recommender_model.get_model()
+            delta = interaction_delta(_run_high_water(last_run), high_water) if last_run is not None else None
+            if not force and current is not None and delta == 0:
+                metrics.increment("training.skipped")
+                return "skipped"
+            now = datetime.now()
+            if (force or current is None or delta is None or delta >= TRAINING_REFIT_THRESHOLD
+                    or (now - current.fitted_at).total_seconds() >= TRAINING_MAX_AGE_SECONDS):
+                kind = "full"
+            else:
+                kind = "fold_in"
+
+            run = models.TrainingRun(started_at=now, status="ok", kind=kind, delta=delta, **high_water)
+            start = time.perf_counter()
+            try:
+                data = recommender_model.build_interaction_matrix(read_db)
+                run.n_users, run.n_posts = data.matrix.shape
+                run.n_likes, run.n_visits = data.n_likes, data.n_visits
+                if kind == "full":
+                    model = recommender_model.fit_model(data)
+                else:
+                    model = recommender_model.fold_in(current, data)
+                if model is not None:
+                    run.engine = model.engine
+                    model.high_water = high_water
+                    recommender_model.publish_model(model)
+            except Exception as e:
+                logger.exception("Error durante el entrenamiento")
+                run.status = "error"
+                run.error = str(e)
+            run.duration_ms = (time.perf_counter() - start) * 1000
+            metrics.observe(f"training.{kind}.duration_ms", run.duration_ms)
+            metrics.increment(f"training.{kind}.{run.status}")
+            logger.info(f"Entrenamiento {kind} {run.status} (delta {delta}): {run.n_users} usuarios x {run.n_posts} posts, "
+                        f"{run.n_likes} likes, {run.n_visits} visitas en {run.duration_ms:.0f} ms")
+            status = run.status
+            db.add(run)
+            db.commit()
+            # Tras un reajuste completo se recalcula el top-N de todos los usuarios; los fold-in
+            # incrementales no (el endpoint descarta los ya vistos y cae al cálculo en vivo)
+            if (status == "ok" and kind == "full" and model is not None
+                    and batch_recommendations.RECOMMENDATIONS_PRECOMPUTE_ENABLED):
+                try:
+                    batch_recommendations.precompute_recommendations(db, model, data)
+                except Exception:
+                    logger.exception("Error al precalcular las recomendaciones")
+                    db.rollback()
+        return status
+    finally:
+        lock.release()
+
+_background_lock = threading.Lock()
+
+def request_training() -> bool:
+    """Lanza run_training en un hilo si no hay otro en curso en este proceso (no bloquea).
+
+    La usan las peticiones que encuentran el modelo frío: responden con el nivel heurístico
+    y las siguientes ya leen el modelo publicado. True si se lanzó.
+    """
+    if not _background_lock.acquire(blocking=False):
+        return False
+
+    def run():
+        try:
+            run_training()
+        except Exception:
+            logger.exception("Error en el entrenamiento en segundo plano")
+        finally:
+            _background_lock.release()
+
+    metrics.increment("training.background")
+    threading.Thread(target=run, name="training", daemon=True).start()
+    return True
+
+class TrainingScheduler:
+    """Tarea asyncio que comprueba periódicamente (en el threadpool) si hay que entrenar"""
+
+    def __init__(self, interval_seconds: int = TRAINING_POLL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            try:
+                await run_in_threadpool(run_training)
+            except Exception:
+                logger.exception("Error en el scheduler de entrenamiento")
+            await asyncio.sleep(self.interval_seconds)
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+scheduler = TrainingScheduler()
@@ -0,0 +1,85 @@
+import logging
+import os
+import threading
+import time
+from typing import List
+
+from sqlalchemy import func, select, union_all
+
+import batch_recommendations
+import candidate_sources
+import metrics
+import models
+import recommender_model
+import session_recommender
+import training
+from database import ReadSessionLocal
+from RecommendationSystem import SIMILAR_POSTS_N, recommendation_system
+
+# Calentamiento al arrancar: modelo, listas de candidatos, co-visitas y cachés de RecommendationSystem para
+# los usuarios activos más recientes y los posts más visitados, dentro de un presupuesto de tiempo
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_BUDGET_SECONDS = float(os.getenv("WARMUP_BUDGET_SECONDS", "20"))
+WARMUP_ACTIVE_USERS = int(os.getenv("WARMUP_ACTIVE_USERS", "200"))
+WARMUP_HOT_POSTS = int(os.getenv("WARMUP_HOT_POSTS", "100"))
+
+logger = logging.getLogger("warmup")
+
+# La aplicación está lista (GET /api/ready) cuando termina el calentamiento
+ready = threading.Event()
+_stop = threading.Event()
+
+def recently_active_users(db, limit: int) -> List[int]:
+    """Usuarios con la interacción (like o visita) más reciente"""
+    activity = union_all(
+        select(models.Like.user_id, models.Like.created_at.label("at")).where(models.Like.user_id != None),
+        select(models.Visit.user_id, models.Visit.visit_date.label("at")).where(models.Visit.user_id != None),
+    ).subquery()
+    return list(db.execute(
+        select(activity.c.user_id).group_by(activity.c.user_id)
+        .order_by(func.max(activity.c.at).desc()).limit(limit)
+    ).scalars().all())
+
+def most_visited_posts(db, limit: int) -> List[int]:
+    return list(db.execute(
+        select(models.Visit.post_id).group_by(models.Visit.post_id)
+        .order_by(func.count(models.Visit.id).desc()).limit(limit)
+    ).scalars().all())
+
+def run(budget_seconds: float = WARMUP_BUDGET_SECONDS):
+    """Calienta lo que quepa en el presupuesto y marca la aplicación como lista (también si falla)"""
+    deadline = time.perf_counter() + budget_seconds
+    start = time.perf_counter()
+    n_users = n_posts = 0
+    try:
+        # Modelo publicado; sin artefacto se entrena en segundo plano (las peticiones no lo esperan)
+        if recommender_model.get_model() is None:
+            training.request_training()
+        with ReadSessionLocal() as db:
+            candidate_sources.load_all(db)
+            session_recommender.covisitation.build(db)
+            users = recently_active_users(db, WARMUP_ACTIVE_USERS)
+            posts = most_visited_posts(db, WARMUP_HOT_POSTS)
+        for user_id in users:
+            if _stop.is_set() or time.perf_counter() >= deadline:
+                break
+            recommendation_system.get_recommendations_for_user(user_id, batch_recommendations.RECOMMENDATIONS_TOP_N)
+            n_users += 1
+        for post_id in posts:
+            if _stop.is_set() or time.perf_counter() >= deadline:
+                break
+            recommendation_system.get_similar_posts(post_id, SIMILAR_POSTS_N)
+            n_posts += 1
+    except Exception:
+        logger.exception("Error durante el calentamiento")
+    finally:
+        duration_ms = (time.perf_counter() - start) * 1000
+        metrics.observe("warmup.duration_ms", duration_ms)
+        metrics.set_gauge("warmup.users", n_users)
+        metrics.set_gauge("warmup.posts", n_posts)
+        logger.info(f"Calentamiento: {n_users} usuarios y {n_posts} posts en {duration_ms:.0f} ms")
+        ready.set()
+
+def stop():
+    """Interrumpe el calentamiento en curso (apagado)"""
+    _stop.set()
@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate, Link } from 'react-router-dom';
 import { useAuth } from '../content/AuthProvider';
-import { getPostById, recordVisit, likePost, getSimilarPosts } from '../services/api';
+import { getPostPage, likePost } from '../services/api';
 import { PostUI } from '../services/api';
 import { useLoginModal } from '../content/LoginModalContext';
 
@@ -26,9 +26,11 @@ const PostDetail: React.FC = () => {
       
       try {
         setLoading(true);
-        const fetchedPost = await getPostById(id, token || undefined);
+        // Una sola petición: post, posts similares y registro de la visita
+        const page = await getPostPage(id, token || undefined);
         
-        if (fetchedPost) {
+        if (page) {
+          const fetchedPost = page.post;
           setPost({
             id: fetchedPost.id,
             titre: fetchedPost.title,
@@ -42,8 +44,7 @@ const PostDetail: React.FC = () => {
           setLiked(fetchedPost.isliked || false);
           setLikeCount(fetchedPost.likes || 0);
           setVisitCount(fetchedPost.visits || 0);
-          const similar = await getSimilarPosts(id);
-          setSimilarPosts(similar);
+          setSimilarPosts(page.similar);
         } else {
           setError("Post no encontrado");
         }
@@ -60,21 +61,6 @@ const PostDetail: React.FC = () => {
 
   
 
-  // Registrar una visita cuando se carga la página
-  useEffect(() => {
-    if (id && !loading && post) {
-      // Registrar la visita (funciona para usuarios autenticados y anónimos)
-      recordVisit(id, token || undefined)
-        .then(() => {
-          // Incrementar el contador de visitas localmente
-          setVisitCount(prev => prev + 1);
-        })
-        .catch(error => {
-          console.error('Error al registrar visita:', error);
-        });
-    }
-  }, [id, loading, post, token]);
-
   const handleLike = async () => {
     if (!isAuthenticated) {
       // Mostrar modal de inicio de sesión si el usuario no está autenticado
@@ -132,13 +132,12 @@ export const getPost = async (id: string, token: string): Promise<Post> => {
   }
 };
 
-export const getPosts = async (token?: string): Promise<Post[]> => {
+export const getPosts = async (token?: string, categorie?: string): Promise<Post[]> => {
   try {
-    const config = token ? {
-      headers: {
-        'Authorization': `Bearer ${token}`
-      }
-    } : {};
+    const config = {
+      headers: token ? { 'Authorization': `Bearer ${token}` } : {},
+      params: categorie ? { categorie } : {}
+    };
     
     const response = await axiosClient.get("/posts", config);
     return response.data;
@@ -147,6 +146,23 @@ export const getPosts = async (token?: string): Promise<Post[]> => {
   }
 };
 
+// Categorías con su número de posts
+export interface CategoryCount {
+  id: number;
+  categorie: string;
+  count: number;
+}
+
+export const getCategories = async (): Promise<CategoryCount[]> => {
+  try {
+    const response = await axiosClient.get("/categories");
+    return response.data;
+  } catch (error: any) {
+    console.error('Error al obtener las categorías:', error);
+    return [];
+  }
+};
+
 // الحصول على منشورات المستخدم الحالي
 export const getMyPosts = async (token: string): Promise<Post[]> => {
   try {
@@ -181,6 +197,19 @@ export const likePost = async (postId: string | number, token: string): Promise<
   }
 };
 
+// Token de sesión del navegador: el backend guarda las últimas lecturas de la sesión
+// para recomendar las siguientes (también a visitantes anónimos)
+const SESSION_ID_KEY = 'session_id';
+
+const getSessionId = (): string => {
+  let sessionId = localStorage.getItem(SESSION_ID_KEY);
+  if (!sessionId) {
+    sessionId = crypto.randomUUID();
+    localStorage.setItem(SESSION_ID_KEY, sessionId);
+  }
+  return sessionId;
+};
+
 // Función para registrar una visita a un post
 export const recordVisit = async (postId: string | number, token?: string): Promise<void> => {
   try {
@@ -188,7 +217,7 @@ export const recordVisit = async (postId: string | number, token?: string): Prom
     const numericId = typeof postId === 'string' ? parseInt(postId, 10) : postId;
     
     // Configurar headers con o sin token de autenticación
-    const headers: Record<string, string> = {};
+    const headers: Record<string, string> = { 'X-Session-Id': getSessionId() };
     if (token) {
       headers['Authorization'] = `Bearer ${token}`;
     }
@@ -232,6 +261,88 @@ export const getPostById = async (postId: string | number, token?: string): Prom
   }
 };
 
+// Página de detalle en una sola petición: post + posts similares (la visita se registra en el servidor)
+export interface PostPage {
+  post: Post;
+  similar: PostUI[];
+}
+
+export const getPostPage = async (postId: string | number, token?: string): Promise<PostPage | null> => {
+  try {
+    const numericId = typeof postId === 'string' ? parseInt(postId, 10) : postId;
+    
+    // Configurar headers con o sin token de autenticación
+    const headers: Record<string, string> = { 'X-Session-Id': getSessionId() };
+    if (token) {
+      headers['Authorization'] = `Bearer ${token}`;
+    }
+    
+    const response = await axiosClient.get(`/posts/${numericId}/page`, { headers });
+    return {
+      post: response.data.post,
+      // Convertir los posts similares al formato PostUI
+      similar: response.data.similar.map((post: any) => ({
+        id: post.id,
+        titre: post.title,
+        image: post.image || "/post.jpg",
+        contenu: post.content,
+        isliked: post.isliked || false,
+        likes: post.likes || 0,
+        visits: post.visits || 0,
+        categorie: post.categorie
+      }))
+    };
+  } catch (error: any) {
+    console.error('Error al obtener la página del post:', error);
+    return null;
+  }
+};
+
+// Búsqueda de texto completo (título y contenido, sin distinguir acentos)
+export interface SearchHit extends Post {
+  score: number;
+}
+
+export interface SearchResults {
+  query: string;
+  total: number;
+  page: number;
+  page_size: number;
+  results: SearchHit[];
+}
+
+export const searchPosts = async (q: string, page: number = 1, pageSize: number = 10, token?: string): Promise<SearchResults> => {
+  try {
+    const headers: Record<string, string> = {};
+    if (token) {
+      headers['Authorization'] = `Bearer ${token}`;
+    }
+    const response = await axiosClient.get('/posts/search', { params: { q, page, page_size: pageSize }, headers });
+    return response.data;
+  } catch (error: any) {
+    console.error('Error al buscar posts:', error);
+    throw error;
+  }
+};
+
+// Varios posts por id en una sola petición (se devuelven en el orden pedido)
+export const getPostsBatch = async (ids: number[], token?: string): Promise<Post[]> => {
+  if (ids.length === 0) {
+    return [];
+  }
+  try {
+    const headers: Record<string, string> = {};
+    if (token) {
+      headers['Authorization'] = `Bearer ${token}`;
+    }
+    const response = await axiosClient.get('/posts/batch', { params: { ids: ids.join(',') }, headers });
+    return response.data;
+  } catch (error: any) {
+    console.error('Error al obtener los posts:', error);
+    throw error;
+  }
+};
+
 // إنشاء منشور جديد
 export const createPost = async (post: { title: string, content: string }, token: string): Promise<Post> => {
   try {
@@ -290,6 +401,33 @@ export const getUserRecommendations = async (userId: string | number, token?: st
   }
 };
 
+// Siguientes lecturas recomendadas a partir de la sesión (funciona sin iniciar sesión)
+export const getSessionRecommendations = async (nRecommendations: number = 4, token?: string): Promise<PostUI[]> => {
+  try {
+    const headers: Record<string, string> = { 'X-Session-Id': getSessionId() };
+    if (token) {
+      headers['Authorization'] = `Bearer ${token}`;
+    }
+    const response = await axiosClient.get('/posts/session/recommendations', {
+      params: { n_recommendations: nRecommendations },
+      headers
+    });
+    return response.data.map((post: any) => ({
+      id: post.id,
+      titre: post.title,
+      image: post.image || "/post.jpg",
+      contenu: post.content,
+      isliked: post.isliked || false,
+      likes: post.likes || 0,
+      visits: post.visits || 0,
+      categorie: post.categorie
+    }));
+  } catch (error: any) {
+    console.error('Error al obtener recomendaciones de la sesión:', error);
+    return [];
+  }
+};
+
 // Función para obtener posts similares a un post específico
 export const getSimilarPosts = async (postId: string | number): Promise<PostUI[]> => {
   try {